@@ -1,30 +1,26 @@
 import functools
+import json
 import pathlib
-from typing import List, Tuple, Union
+import threading
+from typing import List, Tuple, Union, TYPE_CHECKING
 import os
 import anki
 import aqt.utils
 from anki.hooks import addHook
 from aqt import mw, gui_hooks
+from aqt.browser import Browser
 from aqt.editor import Editor
 from aqt.qt import *
-from aqt.utils import showInfo, showWarning
-from bs4 import BeautifulSoup
-
-from .src.About import About
-from .src.AddSingle import AddSingle
-from .src.Config import Config, ConfigObject, OptionType
-from .src.ConfigManager import ConfigManager
-from .src.Exceptions import NoResultsException, FieldNotFoundException
-from .src.FieldSelector import FieldSelector
-from .src.Shtooka import Shtooka, Pronunciation
-from .src.Krdict import Krdict, Pronunciation
-from .src.Naver import Naver, Pronunciation
-from .src.JapanesePod101 import JapanesePod101, Pronunciation
-from .src.JapanesePod101Alt import JapanesePod101Alt, Pronunciation
-from .src.LanguageSelector import LanguageSelector
-from .src.Util import get_field_id, parse_version
-from .src.WhatsNew import get_changelogs, WhatsNew
+from aqt.utils import showInfo, showWarning, tooltip
+
+from .src.Exceptions import NoResultsException, FieldNotFoundException, LookupTimeoutException
+
+if TYPE_CHECKING:
+	from .src.Config import Config
+	from .src.Pronunciation import Pronunciation
+
+"""Everything below the hooks (config, caches, scrapers, dialogs) is only imported or loaded on first use, so the
+add-on costs next to nothing on Anki launches where no audio gets added. See bench/bench_startup.py."""
 
 
 """Release:"""
@@ -39,19 +35,71 @@ log_dir = os.path.join(pathlib.Path(__file__).parent.absolute(), "user_files", "
 
 debug_mode = os.path.isfile(os.path.join(user_files_dir, ".debug"))
 
-"""Ensure directories (create if not existing)"""
-for path in [temp_dir, user_files_dir, log_dir]:
-	if not os.path.exists(path):
-		os.makedirs(path)
+if debug_mode:
+	from .src.Trace import tracer
+	tracer.enable(log_dir)
+
+
+def ensure_dirs():
+	"""Ensure directories (create if not existing)"""
+	for path in [temp_dir, user_files_dir, log_dir]:
+		if not os.path.exists(path):
+			os.makedirs(path)
+
+
+def load_config() -> 'Config':
+	from .src.Config import Config
+	ensure_dirs()
+	return Config(os.path.join(user_files_dir, "config.json"),
+				  os.path.join(asset_dir, "config.template.json")).load_config().load_template().ensure_options()
+
+
+def load_search_cache():
+	from .src.ResultCache import ResultCache
+	ensure_dirs()
+	return ResultCache(os.path.join(user_files_dir, "search_cache.db"))
+
+
+def load_audio_store():
+	from .src.AudioStore import AudioStore
+	ensure_dirs()
+	return AudioStore(os.path.join(user_files_dir, "audio_store.db"))
+
+
+def load_library_index():
+	from .src.LibraryIndex import LibraryIndex
+	ensure_dirs()
+	return LibraryIndex(os.path.join(user_files_dir, "library_index.db"))
+
+
+"""Module attributes that get created the first time they are accessed, e.g. by `from .. import config`"""
+lazy_globals = {
+	"config": load_config,
+	"search_cache": load_search_cache,
+	"audio_store": load_audio_store,
+	"library_index": load_library_index,
+}
+_lazy_lock = threading.Lock()
+
+
+def __getattr__(name: str):
+	if name not in lazy_globals:
+		raise AttributeError("module %r has no attribute %r" % (__name__, name))
+	with _lazy_lock:
+		if name not in globals():  # another thread might have been first
+			globals()[name] = lazy_globals[name]()
+	return globals()[name]
 
-config = Config(os.path.join(user_files_dir, "config.json"),
-				os.path.join(asset_dir, "config.template.json")).load_config().load_template().ensure_options()
+
+def get_config() -> 'Config':
+	return __getattr__("config")
 
 
 def handle_field_select(d, note_type_id, field_type, editor):
+	from .src.Config import ConfigObject, OptionType
 	if d.selected_field is not None:
 		co = ConfigObject(name=field_type, value=d.selected_field, note_type=note_type_id, type=OptionType.TEXT)
-		config.set_note_type_specific_config_object(co)
+		get_config().set_note_type_specific_config_object(co)
 		return co
 	else:
 		showInfo("Cancelled download because fields weren't selected.", editor.widget)
@@ -59,6 +107,16 @@ def handle_field_select(d, note_type_id, field_type, editor):
 
 
 def add_pronunciation(editor: Editor, mode: Union[None, str] = None):
+	from bs4 import BeautifulSoup
+	from .src.Config import ConfigObject, OptionType
+	from .src.FieldSelector import FieldSelector
+	from .src.LanguageSelector import LanguageSelector
+	from .src.Lookup import lookup_pronunciations
+	from .src.Pronunciation import discard_unused
+	from .src.Tasks import BackgroundTask
+	from .src.Trace import tracer
+	config = get_config()
+	
 	if mode is None:
 		modifiers = QApplication.keyboardModifiers()
 		if modifiers == Qt.ShiftModifier:
@@ -128,111 +186,131 @@ def add_pronunciation(editor: Editor, mode: Union[None, str] = None):
 		else:
 			language = config_lang.value
 		
-		try:
-			if language == "ja":
-				kana = editor.note['Reading']
-				jp101 = JapanesePod101(query, language, editor.mw, config, kana).load_search_query()
-				jp101alt = JapanesePod101Alt(query, language, editor.mw, config).load_search_query()
-				results = jp101.get_pronunciations().pronunciations + jp101alt.get_pronunciations().pronunciations
-				if not results:
-					raise NoResultsException()
-			elif language == "ko":
-				naver = Naver(query, language, editor.mw, config).load_search_query().get_pronunciations().pronunciations
-				if naver:
-					results = naver
-				else:
-					krdict = Krdict(query, language, editor.mw, config).load_search_query()
-					if krdict:
-						results = krdict.get_pronunciations().pronunciations
-					else:
-						raise NoResultsException()
-			else:
-				shtooka = Shtooka(query, language, editor.mw, config).load_search_query()
-				if shtooka:
-					results = shtooka.get_pronunciations().pronunciations
-				else:
-					raise NoResultsException()
-		except NoResultsException:
-			showInfo("No results found! :(", editor.widget)
-			return
-		
-		hidden_entries_amount = 0
-		if config.get_config_object("skipOggFallback").value:
-			viable_entries = [p for p in results if not p.is_ogg]
-			hidden_entries_amount = len(results) - len(viable_entries)
-			if len(viable_entries) == 0:
-				showInfo(f"No results found! :(\nThere are {hidden_entries_amount} entries which you chose to skip by deactivating .ogg fallback.")
-				return
-			results = viable_entries
-		
-		
+		note = editor.note
+		trace = tracer.start_trace("lookup", query=query, language=language, mode=mode)
 		if mode == "auto":
-			def add_automatically(auto_results):
-				"""If shift key is held down"""
-				auto_results.sort(key=lambda result: result.votes)  # sort by votes
-				top: Pronunciation = auto_results[len(auto_results) - 1]  # get most upvoted pronunciation
-				top.download_pronunciation()  # download that
-				try:
-					if config.get_config_object("audioFieldAddMode").value == "append":
-						"""append"""
-						editor.note.fields[
-							get_field_id(audio_field, editor.note)] += "[sound:%s]" % top.audio
-					elif config.get_config_object("audioFieldAddMode").value == "replace":
-						"""replace"""
-						editor.note.fields[
-							get_field_id(audio_field, editor.note)] = "[sound:%s]" % top.audio
-					else:
-						"""prepend"""
-						editor.note.fields[
-							get_field_id(audio_field, editor.note)] = "[sound:%s]" % top.audio + editor.note.fields[
-							get_field_id(audio_field, editor.note)]
-				except FieldNotFoundException:
-					showWarning(
-						"Couldn't find field '%s' for adding the audio string. Please create a field with this name or change it in the config for the note type id %s" % (
-							audio_field, str(note_type_id)), editor.widget)
-				
-				if config.get_config_object("playAudioAfterSingleAddAutomaticSelection").value:  # play audio if desired
-					anki.sound.play(top.audio)
-				
-				def flush_field():
-					if not editor.addMode:  # save
-						editor.note.flush()
-					editor.currentField = get_field_id(audio_field, editor.note)
-					editor.loadNote(focusTo=get_field_id(audio_field, editor.note))
-				
-				editor.saveNow(flush_field, keepFocus=True)
+			def on_lookup_failed(e: Exception):
+				trace.finish()
+				if isinstance(e, NoResultsException):
+					showInfo("No results found! :(", editor.widget)
+				elif isinstance(e, LookupTimeoutException):
+					showInfo("The following sources didn't respond in time: %s" % e.specific_info, editor.widget)
+				else:
+					raise e
 			
-			editor.saveNow(functools.partial(add_automatically, results), keepFocus=False)
-		else:
-			dialog = AddSingle(editor.parentWindow, pronunciations=results, hidden_entries_amount=hidden_entries_amount)
-			dialog.exec()
+			def on_lookup_cancelled(results: list):
+				trace.finish()
+				discard_unused(results)
 			
-			Shtooka.cleanup()
-			if dialog.selected_pronunciation is not None:
-				try:
-					add_mode = config.get_config_object("audioFieldAddMode").value
-					if add_mode == "append":
-						editor.note.fields[
-							get_field_id(audio_field,
-										 editor.note)] += "[sound:%s]" % dialog.selected_pronunciation.audio
-					elif add_mode == "prepend":
-						editor.note.fields[
-							get_field_id(audio_field,
-										 editor.note)] = "[sound:%s]" % dialog.selected_pronunciation.audio + \
-														 editor.note.fields[
-															 get_field_id(audio_field,
-																		  editor.note)]
-					elif add_mode == "replace":
-						editor.note.fields[
-							get_field_id(audio_field,
-										 editor.note)] = "[sound:%s]" % dialog.selected_pronunciation.audio
-				except FieldNotFoundException:
-					showWarning(
-						"Couldn't find field '%s' for adding the audio string. Please create a field with this name or change it in the config for the note type id %s" % (
-							audio_field, str(note_type_id)), editor.widget)
-				if not editor.addMode:
-					editor.note.flush()
-				editor.loadNote()
+			BackgroundTask(editor.widget, editor.mw, "Searching audio for '%s'..." % query,
+						   trace.bind(lambda cancelled: lookup_pronunciations(query, language, editor.mw, config, note)),
+						   lambda results: add_top_pronunciation(editor, note, results, audio_field, note_type_id, trace),
+						   on_lookup_failed, on_lookup_cancelled).start()
+		else:
+			open_add_single(editor, note, query, language, audio_field, note_type_id, trace)
+
+
+def add_audio_to_editor(editor: Editor, note, pronunciation: 'Pronunciation', audio_field: str, note_type_id: int, on_added=None, trace=None):
+	"""Downloads a pronunciation in the background and then puts it into the audio field of the editor's note."""
+	from .src.Tasks import BackgroundTask
+	from .src.Trace import span, tracer
+	from .src.Util import add_audio_string, get_field_id
+	config = get_config()
+	if trace is None:
+		trace = tracer.start_trace("download", file=pronunciation.get_file_name())
+	
+	def on_downloaded(_):
+		if editor.note is not note:
+			trace.finish()
+			tooltip("The note was changed while the audio was downloading, so it wasn't added.")
+			return
+		with trace.activate(), span("field", field=audio_field):
+			try:
+				add_audio_string(note, audio_field, pronunciation.audio, config.get_config_object("audioFieldAddMode").value)
+			except FieldNotFoundException:
+				showWarning(
+					"Couldn't find field '%s' for adding the audio string. Please create a field with this name or change it in the config for the note type id %s" % (
+						audio_field, str(note_type_id)), editor.widget)
+			if on_added is not None:
+				on_added()
+			if not editor.addMode:
+				note.flush()
+		trace.finish()
+		editor.currentField = get_field_id(audio_field, note) if audio_field in note.keys() else None
+		editor.loadNote(focusTo=editor.currentField)
+	
+	if pronunciation.audio is not None:
+		on_downloaded(None)
+		return
+	def on_download_failed(e: Exception):
+		trace.finish()
+		raise e
+	
+	BackgroundTask(editor.widget, editor.mw, "Downloading audio...",
+				   trace.bind(lambda cancelled: pronunciation.download_pronunciation()), on_downloaded, on_download_failed).start()
+
+
+def add_top_pronunciation(editor: Editor, note, results: list, audio_field: str, note_type_id: int, trace):
+	"""Continues on the main thread once the lookup has finished and the shift key was held down."""
+	from .src.Pronunciation import discard_unused
+	from .src.Transcode import skip_ogg
+	if editor.note is not note:
+		trace.finish()
+		discard_unused(results)
+		return  # the user moved on to another note in the meantime
+	config = get_config()
+	found = results  # the spooled audio of all of them but the top one gets removed
+	
+	if skip_ogg(config):
+		viable_entries = [p for p in results if not p.is_ogg]
+		hidden_entries_amount = len(results) - len(viable_entries)
+		if len(viable_entries) == 0:
+			trace.finish()
+			discard_unused(results)
+			showInfo(f"No results found! :(\nThere are {hidden_entries_amount} entries which you chose to skip by deactivating .ogg fallback.")
+			return
+		results = viable_entries
+	
+	results.sort(key=lambda result: result.votes)  # sort by votes
+	top: 'Pronunciation' = results[len(results) - 1]  # get most upvoted pronunciation
+	discard_unused(found, top)
+	
+	def play_top():
+		if config.get_config_object("playAudioAfterSingleAddAutomaticSelection").value:  # play audio if desired
+			anki.sound.play(top.audio)
+	
+	editor.saveNow(lambda: add_audio_to_editor(editor, note, top, audio_field, note_type_id, play_top, trace), keepFocus=False)
+
+
+def open_add_single(editor: Editor, note, query: str, language: str, audio_field: str, note_type_id: int, trace):
+	"""Opens the selection dialog right away and fills it as each source responds."""
+	from .src.AddSingle import AddSingle
+	from .src.Lookup import LookupEngine, get_lookup_tasks
+	from .src.Pronunciation import discard_unused
+	from .src.Transcode import skip_ogg
+	config = get_config()
+	tasks = get_lookup_tasks(query, language, editor.mw, config, note)
+	dialog = AddSingle(editor.parentWindow, pronunciations=[], hidden_entries_amount=0, sources=[task.name for task in tasks])
+	skip_ogg_entries = skip_ogg(config)
+	
+	def on_result(source: str, results: list, error: Union[Exception, None]):
+		"""Runs on a lookup thread"""
+		viable_entries = [p for p in results if not p.is_ogg] if skip_ogg_entries else results
+		discard_unused([p for p in results if p.is_ogg] if skip_ogg_entries else [])
+		editor.mw.taskman.run_on_main(
+			functools.partial(dialog.add_results, source, viable_entries, error, len(results) - len(viable_entries)))
+	
+	def on_dialog_finished(_):
+		if dialog.selected_pronunciation is not None and editor.note is note:
+			add_audio_to_editor(editor, note, dialog.selected_pronunciation, audio_field, note_type_id, trace=trace)
+		else:
+			dialog.selected_pronunciation = None
+			trace.finish()
+		dialog.discard_unused()
+	
+	dialog.finished.connect(on_dialog_finished)
+	dialog.open()
+	editor.mw.taskman.run_in_background(trace.bind(lambda: LookupEngine().run(tasks, on_result=on_result)), lambda future: future.result())
 
 
 def on_editor_btn_click(editor: Editor, mode: Union[None, str] = None):
@@ -242,7 +320,8 @@ def on_editor_btn_click(editor: Editor, mode: Union[None, str] = None):
 def add_editor_button(buttons: List[str], editor: Editor):
 	editor._links["audio_dl"] = on_editor_btn_click
 	if os.path.isabs(os.path.join(asset_dir, "icon.png")):
-		iconstr = editor.resourceToData(os.path.join(asset_dir, "icon.png"))
+		from .src.Assets import get_assets
+		iconstr = get_assets().data_uri("icon.png")  # encoded once, not for every editor
 	else:
 		iconstr = "/_anki/imgs/{}.png".format(os.path.join(asset_dir, "icon.png"))
 	
@@ -257,15 +336,75 @@ def add_editor_shortcut(shortcuts: List[Tuple], editor: Editor):
 
 
 def on_pref_btn_click():
-	config_manager = ConfigManager(config)
+	from .src.ConfigManager import ConfigManager
+	config_manager = ConfigManager(get_config())
 	config_manager.exec()
 
 
+def on_bulk_add_click(browser: Browser):
+	from .src.BulkAdd import BulkAdd
+	BulkAdd(browser, get_config()).start()
+
+
+def add_browser_menu(browser: Browser):
+	bulk_add_action = QAction("Add audio to selected notes (audio-dl)", browser)
+	bulk_add_action.triggered.connect(lambda: on_bulk_add_click(browser))  # type: ignore
+	browser.form.menuEdit.addSeparator()
+	browser.form.menuEdit.addAction(bulk_add_action)
+
+
+def on_clear_misses_click():
+	from . import search_cache
+	removed = search_cache.clear_misses()
+	tooltip("Forgot %d words without audio. They will be looked up again." % removed)
+
+
+def on_rescan_library_click():
+	from .src.LocalLibrary import get_library_folder
+	from .src.Tasks import BackgroundTask
+	from . import library_index
+	folder = get_library_folder(get_config())
+	if not os.path.isdir(folder):
+		showInfo("Put folders with audio files (e.g. downloaded Shtooka collections) into '%s' or choose another folder in the preferences." % folder)
+		return
+	BackgroundTask(mw, mw, "Scanning the local audio library...", lambda cancelled: library_index.refresh(folder),
+				   lambda counts: tooltip("Indexed %d new or changed files, removed %d." % counts)).start()
+
+
+def on_copy_timings_click():
+	from .src.Trace import tracer
+	report = tracer.last_report()
+	if report is None:
+		showInfo("No timings were recorded yet. They are only recorded while debug logging is on, i.e. if the file '%s' exists when Anki starts." % os.path.join(user_files_dir, ".debug"))
+		return
+	QApplication.clipboard().setText(report)
+	tooltip("Copied the timings of the last lookup, you can paste them into a bug report.")
+
+
 def on_about_btn_click():
 	showInfo(f"VERSION: v.{release_ver}.")
 
 
+def flush_config():
+	if "config" in globals():  # nothing to write if the config was never loaded
+		get_config().flush()
+
+
+def read_config_version() -> str:
+	"""configVersion straight from config.json, so that starting Anki doesn't load the whole config."""
+	try:
+		with open(os.path.join(user_files_dir, "config.json"), encoding="utf8") as f:
+			return json.load(f).get("configVersion", "1.0.0")
+	except (OSError, ValueError):
+		return "1.0.0"  # the template's default, i.e. a new install
+
+
 def show_whats_new():
+	if read_config_version() == release_ver:
+		return
+	from .src.Util import parse_version
+	from .src.WhatsNew import get_changelogs, WhatsNew
+	config = get_config()
 	config_ver_obj = config.get_config_object("configVersion")
 	config_ver = config_ver_obj.value
 	changelogs = get_changelogs(config_ver)
@@ -276,19 +415,29 @@ def show_whats_new():
 		config.set_config_object(config_ver_obj)
 
 
-about = About(mw)
 addHook("setupEditorButtons", add_editor_button)
 gui_hooks.editor_did_init_shortcuts.append(add_editor_shortcut)
 
 gui_hooks.main_window_did_init.append(show_whats_new)
+gui_hooks.browser_menus_did_init.append(add_browser_menu)
+gui_hooks.profile_will_close.append(flush_config)
 
 menu = QMenu("audio-dl", aqt.mw)
 pref_action = QAction("Preferences", menu)
+clear_misses_action = QAction("Look up words without audio again", menu)
+rescan_library_action = QAction("Rescan local audio library", menu)
+copy_timings_action = QAction("Copy timings of the last lookup", menu)
 about_action = QAction("About", menu)
 menu.addAction(pref_action)
+menu.addAction(clear_misses_action)
+menu.addAction(rescan_library_action)
+menu.addAction(copy_timings_action)
 menu.addAction(about_action)
 
 pref_action.triggered.connect(on_pref_btn_click)  # type: ignore
+clear_misses_action.triggered.connect(on_clear_misses_click)  # type: ignore
+rescan_library_action.triggered.connect(on_rescan_library_click)  # type: ignore
+copy_timings_action.triggered.connect(on_copy_timings_click)  # type: ignore
 about_action.triggered.connect(on_about_btn_click)  # type: ignore
 
 aqt.mw.form.menuTools.addMenu(menu)
@@ -0,0 +1,89 @@
+"""Compares the old per-request urllib opener with the shared pooled Transport on a search-then-download sequence.
+
+Runs against a local stand-in server and counts how many TCP connections (and therefore TLS handshakes on the real
+sites) each variant opens:
+
+    python bench/bench_http.py [words]
+"""
+import importlib
+import os
+import sys
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_http_module():
+    sys.path.insert(0, root)
+    return importlib.import_module("src.Http")
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    disable_nagle_algorithm = True
+    connections = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with StandInHandler.lock:
+            StandInHandler.connections += 1
+
+    def do_GET(self):
+        body = b"<html><body><a href='/audio/word.mp3'>word</a></body></html>" if self.path.startswith("/search") else b"\xff\xfb" * 4096
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def run_urllib(base: str, words: int):
+    """What every source did before: build and install a fresh opener, then urlopen without keep-alive."""
+    for i in range(words):
+        opener = urllib.request.build_opener()
+        opener.addheaders = [("User-Agent", "bench")]
+        urllib.request.install_opener(opener)
+        urllib.request.urlopen(base + "/search?q=%d" % i).read()
+        urllib.request.urlopen(base + "/audio/%d.mp3" % i).read()
+
+
+def run_transport(base: str, words: int, transport):
+    for i in range(words):
+        transport.get(base + "/search?q=%d" % i).content
+        transport.get(base + "/audio/%d.mp3" % i).content
+
+
+def measure(name: str, fn):
+    StandInHandler.connections = 0
+    started = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - started
+    print("%-10s %6d connections  %8.1f ms" % (name, StandInHandler.connections, elapsed * 1000))
+    return StandInHandler.connections
+
+
+def main():
+    words = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = "http://127.0.0.1:%d" % server.server_address[1]
+
+    http = load_http_module()
+    # unthrottled, the per-host rate limits would be all that gets measured
+    transport = http.Transport(limiter=http.RateLimiter({}, fallback_rate=(1e6, 1000)))
+    print("search + download for %d words (%d requests per variant)" % (words, words * 2))
+    before = measure("urllib", lambda: run_urllib(base, words))
+    after = measure("transport", lambda: run_transport(base, words, transport))
+    print("saved handshakes: %d" % (before - after))
+    transport.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
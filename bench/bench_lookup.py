@@ -0,0 +1,215 @@
+"""End-to-end latency of the sources against recorded responses (see replay.py), with p50/p95 per step.
+
+For every source the search (load_search_query), the parsing (get_pronunciations) and the download of each
+pronunciation (download_pronunciation) are timed separately, followed by the full lookup path that the editor
+runs (lookup_pronunciations with all sources of a language, without the search cache and with it).
+
+    python bench/bench_lookup.py [runs] [--server] [--latency F] [--rate-limit] [--record]
+
+By default the recordings are answered in-process, which shows the add-on's own overhead. --server answers them
+from a local stand-in server instead, so connection handling is part of the numbers, and --latency F waits F times
+the recorded response time before every answer. The per-host rate limits are lifted unless --rate-limit is given.
+
+--record queries the real sites once per case and saves their responses to bench/fixtures/http, replacing the
+recordings of the same requests.
+"""
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from replay import FixtureStore, RecordingAdapter, ReplayAdapter, StandInAdapter, StandInServer, mount
+from stubs import install_stubs, load_addon
+
+package_name = "audio_dl_bench"
+
+"""(source, word, language, reading) searched by the per-source benchmark"""
+source_cases = [
+    ("Naver", "사과", "ko", None),
+    ("Krdict", "사과", "ko", None),
+    ("Shtooka", "maison", "fr", None),
+    ("JapanesePod101", "猫", "ja", "ねこ"),
+    ("JapanesePod101", "犬", "ja", "いぬ"),  # "audio not available" placeholder
+    ("JapanesePod101Alt", "猫", "ja", None),
+    ("LocalLibrary", "Hund", "de", None),
+]
+
+"""(word, language, reading) looked up through all sources of the language"""
+lookup_cases = [
+    ("사과", "ko", None),
+    ("maison", "fr", None),
+    ("猫", "ja", "ねこ"),
+]
+
+
+class BenchMedia:
+    """The part of Anki's media manager the downloads use: files get moved into a folder."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def dir(self) -> str:
+        return self.path
+
+    def add_file(self, path: str) -> str:
+        name = os.path.basename(path)
+        shutil.move(path, os.path.join(self.path, name))
+        return name
+
+
+class BenchMainWindow:
+    def __init__(self, media_dir: str):
+        self.col = type("Collection", (), {"media": BenchMedia(media_dir)})()
+
+
+def percentile(samples: List[float], p: float) -> float:
+    """Nearest-rank percentile."""
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def setup_addon(work_dir: str):
+    """Imports the add-on with its user files and temp folder in `work_dir` and a small local library."""
+    install_stubs()
+    addon = load_addon(package_name)
+    addon.user_files_dir = os.path.join(work_dir, "user_files")
+    addon.temp_dir = os.path.join(work_dir, "temp")
+    addon.log_dir = os.path.join(addon.user_files_dir, "logs")
+    addon.ensure_dirs()
+    library = os.path.join(addon.user_files_dir, "library", "de")
+    os.makedirs(library)
+    fixtures = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "http")
+    for name in ["Hund.mp3", "Hund_2.mp3", "Katze.mp3"]:
+        shutil.copyfile(os.path.join(fixtures, "audio.mp3"), os.path.join(library, name))
+    addon.library_index.refresh(os.path.dirname(library))  # lookups only build it in the background
+    return addon
+
+
+def make_source(addon, name: str, word: str, language: str, reading, mw):
+    from importlib import import_module
+    sources = import_module(package_name + ".src.Sources")
+    lookup = import_module(package_name + ".src.Lookup")
+    note = {"Reading": reading} if reading is not None else None
+    return lookup.make_source(sources.get_source(name), word, language, mw, addon.config, note)
+
+
+def fresh_audio_store(addon, work_dir: str, run: int):
+    """Every run starts with an empty audio store, otherwise only the first run would download anything."""
+    from importlib import import_module
+    audio_store = import_module(package_name + ".src.AudioStore")
+    addon.audio_store = audio_store.AudioStore(os.path.join(work_dir, "audio_store-%d.db" % run))
+
+
+def bench_sources(addon, work_dir: str, runs: int, mw) -> Dict[str, Dict[str, List[float]]]:
+    timings: Dict[str, Dict[str, List[float]]] = {}
+    for run in range(runs):
+        fresh_audio_store(addon, work_dir, run)
+        for name, word, language, reading in source_cases:
+            steps = timings.setdefault("%s %s" % (name, word), {})
+            source = make_source(addon, name, word, language, reading, mw)
+            started = time.perf_counter()
+            loaded = source.load_search_query()
+            steps.setdefault("load_search_query", []).append(time.perf_counter() - started)
+            if loaded is None:
+                continue
+            started = time.perf_counter()
+            try:
+                source.get_pronunciations()
+            except addon.NoResultsException:
+                pass
+            steps.setdefault("get_pronunciations", []).append(time.perf_counter() - started)
+            for pronunciation in source.pronunciations:
+                started = time.perf_counter()
+                pronunciation.download_pronunciation()
+                steps.setdefault("download_pronunciation", []).append(time.perf_counter() - started)
+    return timings
+
+
+def bench_lookups(addon, runs: int, mw) -> Dict[str, Dict[str, List[float]]]:
+    from importlib import import_module
+    config_module = import_module(package_name + ".src.Config")
+    lookup = import_module(package_name + ".src.Lookup")
+    timings: Dict[str, Dict[str, List[float]]] = {}
+    for cached in [False, True]:
+        option = addon.config.get_config_object("cacheSearchResults")
+        addon.config.set_config_object(config_module.ConfigObject(option.name, option.type, value=cached))
+        for run in range(runs):
+            for word, language, reading in lookup_cases:
+                note = {"Reading": reading} if reading is not None else None
+                started = time.perf_counter()
+                lookup.lookup_pronunciations(word, language, mw, addon.config, note)
+                elapsed = time.perf_counter() - started
+                step = "lookup_pronunciations" + (" (cached)" if cached else "")
+                timings.setdefault("lookup %s %s" % (language, word), {}).setdefault(step, []).append(elapsed)
+    return timings
+
+
+def report(timings: Dict[str, Dict[str, List[float]]]):
+    print("%-28s %-32s %5s %9s %9s" % ("case", "step", "n", "p50 ms", "p95 ms"))
+    for case, steps in timings.items():
+        for step, samples in steps.items():
+            print("%-28s %-32s %5d %9.2f %9.2f" % (case, step, len(samples), percentile(samples, 50) * 1000,
+                                                   percentile(samples, 95) * 1000))
+
+
+def main():
+    args = sys.argv[1:]
+    latency = 0.0
+    if "--latency" in args:
+        i = args.index("--latency")
+        latency = float(args[i + 1])
+        del args[i:i + 2]
+    flags = {arg for arg in args if arg.startswith("--")}
+    args = [arg for arg in args if not arg.startswith("--")]
+    runs = int(args[0]) if args else 20
+
+    work_dir = tempfile.mkdtemp(prefix="audio-dl-bench-")
+    addon = server = None
+    try:
+        addon = setup_addon(work_dir)
+        from importlib import import_module
+        http = import_module(package_name + ".src.Http")
+        transport = http.get_transport()
+        if "--rate-limit" not in flags and "--record" not in flags:
+            transport.limiter = http.RateLimiter({}, fallback_rate=(1e6, 1000))
+        store = FixtureStore()
+        mw = BenchMainWindow(os.path.join(work_dir, "media"))
+
+        if "--record" in flags:
+            mount(transport.session, RecordingAdapter(store))
+            bench_sources(addon, work_dir, 1, mw)
+            store.save()
+            print("Saved %d recorded responses to %s" % (len(store.exchanges), store.path))
+            return
+
+        if "--server" in flags:
+            server = StandInServer(store, latency).start()
+            adapter = StandInAdapter(server)
+        else:
+            adapter = ReplayAdapter(store, latency)
+        mount(transport.session, adapter)
+
+        timings = bench_sources(addon, work_dir, runs, mw)
+        timings.update(bench_lookups(addon, runs, mw))
+        print("%d runs, responses %s%s" % (runs, "from a stand-in server" if server else "replayed in-process",
+                                          ", %.2fx recorded latency" % latency if latency else ""))
+        report(timings)
+        misses = server.misses if server else adapter.misses
+        if misses:
+            print("\nRequests without a recording:")
+            for url in sorted(set(misses)):
+                print("    " + url)
+    finally:
+        if server is not None:
+            server.stop()
+        if addon is not None and "config" in vars(addon):
+            addon.config.flush()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Per-source parse time of the saved sample pages in bench/fixtures, before and after the extraction layer.
+
+"before" is the original full-page BeautifulSoup(page, "html.parser") walk, every other column is one of the
+backends of src/Extract.py that is installed. The results of every backend are checked against "before".
+
+    python bench/bench_parse.py [repetitions]
+"""
+import importlib.util
+import os
+import re
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+fixtures_dir = os.path.join(root, "bench", "fixtures")
+
+
+def load_extract_module():
+    spec = importlib.util.spec_from_file_location("audio_dl_extract", os.path.join(root, "src", "Extract.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def read_fixture(name: str) -> bytes:
+    with open(os.path.join(fixtures_dir, name), "rb") as f:
+        return f.read()
+
+
+def legacy_krdict(page):
+    html = BeautifulSoup(page, "html.parser")
+    records = []
+    for pronunciation in html.find_all("span", class_="search_sub"):
+        for link in pronunciation.find_all("a"):
+            link.span.clear()
+            subtitle = link.find_previous().get_text().strip() + ' - ' + link.find_parent().find_parent().find_parent().dd.get_text().replace('1.', '').strip().split(';')[0]
+            dl_url = link.get('href').replace('javascript:fnSoundPlay(\'', '').replace('\');', '')
+            records.append({"subtitle": subtitle, "url": dl_url})
+    return records
+
+
+def legacy_shtooka(page):
+    html = BeautifulSoup(page, "html.parser")
+    records = []
+    after_script = html.find_all('script')[4].next_sibling.next_sibling
+    if after_script.name == 'div':
+        for pronunciation in html.find_all("h1", class_="nice"):
+            for sound in pronunciation.find_all("img", class_="player_mini"):
+                records.append({"subtitle": sound.get('title'),
+                                "url": sound.get('onclick').split('\'')[5].replace("http://", "https://"),
+                                "headword": sound.find_parent().get_text().strip()})
+    elif after_script.name == 'h2':
+        if after_script.string.startswith('Matching recordings:'):
+            for pronunciation in html.find_all("div", class_="sound"):
+                records.append({"subtitle": pronunciation.find("div", class_="sound_top").span.get_text().replace("\n", "").replace("\t", ""),
+                                "url": pronunciation.find("div", class_="sound_top").find("div", class_="download").ul.find("a").get('href').replace("http://", "https://"),
+                                "headword": re.sub(r'(«\s)|(\s»)', '', re.sub(r'[\t\n]', '', pronunciation.find("div", class_="sound_bottom").get_text()).strip())})
+    return records
+
+
+def legacy_jp101alt(page):
+    html = BeautifulSoup(page, "html.parser")
+    return [{"subtitle": row.find(class_='dc-vocab_kana').get_text(),
+             "url": row.find(class_='dc-result-row__player-field').div.audio.source.get('src')}
+            for row in html.find_all(class_='dc-box--white dc-result-row')]
+
+
+samples = [
+    ("Krdict", "krdict.html", legacy_krdict),
+    ("Shtooka", "shtooka.html", legacy_shtooka),
+    ("Shtooka", "shtooka_matching.html", legacy_shtooka),
+    ("JapanesePod101Alt", "jp101alt.html", legacy_jp101alt),
+]
+
+
+def timed(fn, page, repetitions: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repetitions):
+        fn(page)
+    return (time.perf_counter() - started) / repetitions * 1000
+
+
+def main():
+    repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    extract = load_extract_module()
+    backends = extract.available_backends
+    print("%-24s %9s %10s" % ("sample", "size", "before") + "".join("%12s" % b for b in backends) + "   (ms per parse)")
+    for source, fixture, legacy in samples:
+        page = read_fixture(fixture)
+        expected = legacy(page)
+        row = "%-24s %8dk %10.2f" % (fixture, len(page) // 1024, timed(legacy, page, repetitions))
+        for backend in backends:
+            fn = extract.extractors[(source, backend)]
+            if fn(page) != expected:
+                print("%s: %s returned different results than before" % (fixture, backend))
+                print("  before: %s\n  after:  %s" % (expected, fn(page)))
+            row += "%12.2f" % timed(fn, page, repetitions)
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
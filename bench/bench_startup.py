@@ -0,0 +1,120 @@
+"""Cost of loading the add-on when Anki starts, measured against stub aqt/anki/PyQt5 modules.
+
+Every run imports the add-on in a fresh interpreter and reports how long the import took, how many files were opened
+while it ran (source files, config files, databases, ...) and which heavy third-party modules got pulled in. The hooks
+the add-on registers on main_window_did_init are run as well, against a config.json that is already up to date, like
+on any launch after the first one. Nothing besides registering hooks and the Tools menu should happen at that point.
+
+    python bench/bench_startup.py [runs] [--max-ms N] [--max-files N]
+
+With --max-ms/--max-files the script exits with status 1 if the median import time or the number of opened files
+is above the limit, so it can be used to catch regressions.
+"""
+import importlib.util
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from stubs import install_stubs
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+package_name = "audio_dl_bench"
+
+"""Modules that are expensive to import and only needed once audio actually gets looked up"""
+heavy_modules = ["bs4", "requests", "urllib3", "sqlite3", "lxml", "selectolax", "concurrent.futures"]
+
+
+"""Hooks that Anki runs while it starts"""
+startup_hooks = ["main_window_did_init"]
+
+
+def measure_once() -> dict:
+    """Imports the add-on once in this interpreter and runs its startup hooks."""
+    install_stubs()
+    import aqt
+    user_files_dir = tempfile.mkdtemp(prefix="audio-dl-startup-")
+    opened = []
+
+    def audit(event, args):
+        if event == "open" and isinstance(args[0], str):
+            opened.append(args[0])
+
+    modules_before = set(sys.modules)
+    sys.addaudithook(audit)
+    started = time.perf_counter()
+    spec = importlib.util.spec_from_file_location(package_name, os.path.join(root, "__init__.py"),
+                                                  submodule_search_locations=[root])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[package_name] = module
+    spec.loader.exec_module(module)
+    elapsed = time.perf_counter() - started
+
+    # writing the config is set-up, not part of the measurement
+    count = len(opened)
+    module.user_files_dir = user_files_dir
+    with open(os.path.join(user_files_dir, "config.json"), "w", encoding="utf8") as f:
+        json.dump({"configVersion": module.release_ver}, f)
+    del opened[count:]
+
+    started = time.perf_counter()
+    for hook in startup_hooks:
+        for callback in getattr(aqt.gui_hooks, hook):
+            callback()
+    elapsed = (elapsed + time.perf_counter() - started) * 1000
+    opened = list(dict.fromkeys(opened))
+    new_modules = set(sys.modules) - modules_before
+    return {
+        "ms": elapsed,
+        "files": len(opened),
+        "addon_files": sorted(os.path.relpath(p, root) for p in opened if p.startswith(root))
+                       + sorted(os.path.join("user_files", os.path.relpath(p, user_files_dir))
+                                for p in opened if p.startswith(user_files_dir)),
+        "heavy": [m for m in heavy_modules if m in new_modules],
+        "modules": len([m for m in new_modules if m.startswith(package_name)]),
+    }
+
+
+def main():
+    args = sys.argv[1:]
+    if args == ["--child"]:
+        print(json.dumps(measure_once()))
+        return
+
+    limits = {}
+    for flag in ["--max-ms", "--max-files"]:
+        if flag in args:
+            i = args.index(flag)
+            limits[flag] = float(args[i + 1])
+            del args[i:i + 2]
+    runs = int(args[0]) if args else 10
+
+    results = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "--child"], capture_output=True, text=True, check=True)
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    last = results[-1]
+    median_ms = statistics.median(r["ms"] for r in results)
+    print("import time:    %.1f ms median, %.1f ms min over %d runs" % (median_ms, min(r["ms"] for r in results), runs))
+    print("files opened:   %d (%d of them in the add-on folder)" % (last["files"], len(last["addon_files"])))
+    print("add-on modules: %d" % last["modules"])
+    print("heavy imports:  %s" % (", ".join(last["heavy"]) or "none"))
+    for path in last["addon_files"]:
+        print("    " + path)
+
+    failed = False
+    if "--max-ms" in limits and median_ms > limits["--max-ms"]:
+        print("import time is above the limit of %.0f ms" % limits["--max-ms"])
+        failed = True
+    if "--max-files" in limits and last["files"] > limits["--max-files"]:
+        print("more than %d files were opened" % limits["--max-files"])
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""Record/replay layer for the HTTP traffic of the sources, so lookups can be benchmarked without the real sites.
+
+Exchanges are kept in fixtures/http/index.json: method, URL, a hash of the request body (POST searches), status,
+headers, the file holding the response body and how long the site took to answer. Bodies live next to the index,
+paths are relative to it, so the HTML fixtures of bench_parse.py are shared.
+
+Three ways to plug it into Transport.session:
+
+- RecordingAdapter sends requests to the real sites and saves what came back,
+- ReplayAdapter answers from the fixtures in-process, without any sockets,
+- StandInServer serves the fixtures over local HTTP, with StandInAdapter pointing the sources' URLs at it, so
+  connection pooling and streaming behave like they do against the sites.
+
+Both replay variants can wait the recorded response time (times `latency`) before answering. Requests without a
+recording are answered with a 404, which the sources treat as "nothing found".
+
+    python bench/replay.py serve [port]
+"""
+import hashlib
+import http.client
+import io
+import json
+import os
+import sys
+import threading
+import time
+import urllib.parse
+from dataclasses import asdict, dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Tuple, Union
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+fixtures_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "http")
+
+"""Response headers worth keeping, everything else (cookies, dates, CDN noise) is dropped when recording"""
+kept_headers = ("Content-Type", "Content-Encoding", "Retry-After")
+
+"""File extensions for recorded bodies, by content type"""
+body_extensions = {"text/html": ".html", "application/json": ".json", "audio/mpeg": ".mp3", "audio/ogg": ".ogg",
+                   "audio/wav": ".wav", "audio/x-wav": ".wav"}
+
+
+def body_hash(body: Union[str, bytes, None]) -> str:
+    if not body:
+        return ""
+    if isinstance(body, str):
+        body = body.encode("utf8")
+    return hashlib.sha1(body).hexdigest()
+
+
+@dataclass
+class Exchange:
+    method: str
+    url: str
+    body: str  # hash of the request body, empty for requests without one
+    status: int
+    file: str  # response body, relative to the index
+    headers: Dict[str, str] = field(default_factory=dict)
+    elapsed: float = 0.0  # seconds the site took to send the whole response
+
+
+class FixtureStore:
+    """The recorded exchanges of one fixtures folder."""
+
+    def __init__(self, path: str = fixtures_dir):
+        self.path = path
+        self.index_path = os.path.join(path, "index.json")
+        self.exchanges: Dict[Tuple[str, str, str], Exchange] = {}
+        self._bodies: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+        if os.path.isfile(self.index_path):
+            with open(self.index_path, encoding="utf8") as f:
+                for record in json.load(f):
+                    exchange = Exchange(**record)
+                    self.exchanges[(exchange.method, exchange.url, exchange.body)] = exchange
+
+    def find(self, method: str, url: str, body: Union[str, bytes, None]) -> Union[Exchange, None]:
+        return self.exchanges.get((method.upper(), url, body_hash(body)))
+
+    def read_body(self, exchange: Exchange) -> bytes:
+        with self._lock:
+            data = self._bodies.get(exchange.file)
+            if data is None:
+                with open(os.path.join(self.path, exchange.file), "rb") as f:
+                    data = self._bodies[exchange.file] = f.read()
+            return data
+
+    def add(self, request: requests.PreparedRequest, response: requests.Response, elapsed: float):
+        """Saves a live exchange. Bodies are stored under their hash, so identical responses share a file."""
+        content = response.content
+        content_type = response.headers.get("Content-Type", "").split(";")[0].strip()
+        file_name = hashlib.sha1(content).hexdigest()[:16] + body_extensions.get(content_type, ".bin")
+        headers = {name: response.headers[name] for name in kept_headers if name in response.headers}
+        exchange = Exchange(request.method, request.url, body_hash(request.body), response.status_code, file_name,
+                            headers, round(elapsed, 4))
+        with self._lock:
+            os.makedirs(self.path, exist_ok=True)
+            with open(os.path.join(self.path, file_name), "wb") as f:
+                f.write(content)
+            self.exchanges[(exchange.method, exchange.url, exchange.body)] = exchange
+            self._bodies[file_name] = content
+
+    def save(self):
+        with self._lock:
+            records = [asdict(exchange) for exchange in self.exchanges.values()]
+            with open(self.index_path, "w", encoding="utf8") as f:
+                json.dump(records, f, ensure_ascii=False, indent=1)
+                f.write("\n")
+
+
+class RecordingAdapter(HTTPAdapter):
+    """Talks to the real sites and adds every exchange to the store."""
+
+    def __init__(self, store: FixtureStore, **kwargs):
+        super().__init__(**kwargs)
+        self.store = store
+
+    def send(self, request, **kwargs):
+        started = time.perf_counter()
+        response = super().send(request, **kwargs)
+        response.content  # read streamed bodies as well, they stay readable through iter_content
+        self.store.add(request, response, time.perf_counter() - started)
+        return response
+
+
+class ReplayAdapter(BaseAdapter):
+    """Answers requests from the store without touching the network."""
+
+    def __init__(self, store: FixtureStore, latency: float = 0.0):
+        super().__init__()
+        self.store = store
+        self.latency = latency
+        self.misses = []
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        exchange = self.store.find(request.method, request.url, request.body)
+        if exchange is None:
+            self.misses.append(request.url)
+            status, headers, data = 404, {}, b""
+        else:
+            if self.latency:
+                time.sleep(exchange.elapsed * self.latency)
+            status, headers, data = exchange.status, exchange.headers, self.store.read_body(exchange)
+        response = requests.Response()
+        response.status_code = status
+        response.reason = http.client.responses.get(status, "")
+        response.headers = CaseInsensitiveDict(headers)
+        response.headers["Content-Length"] = str(len(data))
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.raw = io.BytesIO(data)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self):
+        pass
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Serves /<scheme>/<host>/<path> with the recording of <scheme>://<host>/<path>."""
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real sites
+    disable_nagle_algorithm = True
+    server: "StandInServer"
+
+    def do_GET(self):
+        self.answer(None)
+
+    def do_POST(self):
+        self.answer(self.rfile.read(int(self.headers.get("Content-Length") or 0)))
+
+    def answer(self, body: Union[bytes, None]):
+        scheme, _, rest = self.path.lstrip("/").partition("/")
+        url = scheme + "://" + rest
+        exchange = self.server.store.find(self.command, url, body)
+        if exchange is None:
+            self.server.misses.append(url)
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.server.latency:
+            time.sleep(exchange.elapsed * self.server.latency)
+        data = self.server.store.read_body(exchange)
+        self.send_response(exchange.status)
+        for name, value in exchange.headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInServer(ThreadingHTTPServer):
+    """Local HTTP server answering with the recorded responses. Runs on a background thread once started."""
+    daemon_threads = True
+
+    def __init__(self, store: FixtureStore, latency: float = 0.0, port: int = 0):
+        super().__init__(("127.0.0.1", port), StandInHandler)
+        self.store = store
+        self.latency = latency
+        self.misses = []
+
+    @property
+    def base_url(self) -> str:
+        return "http://127.0.0.1:%d" % self.server_address[1]
+
+    def rewrite(self, url: str) -> str:
+        """Maps a URL of one of the sites to the stand-in."""
+        parts = urllib.parse.urlsplit(url)
+        return "%s/%s/%s%s" % (self.base_url, parts.scheme, parts.netloc, url[len(parts.scheme) + 3 + len(parts.netloc):])
+
+    def handle_error(self, request, client_address):
+        """Clients dropping kept-alive connections, e.g. when the benchmark ends, are expected and not worth a
+        traceback."""
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def start(self) -> "StandInServer":
+        threading.Thread(target=self.serve_forever, name="stand-in-server", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class StandInAdapter(HTTPAdapter):
+    """Sends every request to the stand-in server instead of the site in its URL."""
+
+    def __init__(self, server: StandInServer, **kwargs):
+        super().__init__(**kwargs)
+        self.server = server
+
+    def send(self, request, **kwargs):
+        request = request.copy()
+        request.url = self.server.rewrite(request.url)
+        return super().send(request, **kwargs)
+
+
+def mount(session: requests.Session, adapter: BaseAdapter):
+    """Routes all of the session's requests through `adapter`."""
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+
+def main():
+    args = sys.argv[1:]
+    if not args or args[0] != "serve":
+        print(__doc__)
+        sys.exit(2)
+    store = FixtureStore()
+    server = StandInServer(store, port=int(args[1]) if len(args) > 1 else 8101)
+    print("Serving %d recorded responses on %s/<scheme>/<host>/<path>" % (len(store.exchanges), server.base_url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
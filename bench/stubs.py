@@ -0,0 +1,83 @@
+"""Stand-ins for aqt, anki and PyQt5, so the add-on can be imported and driven outside of Anki by the benchmarks."""
+import importlib.util
+import os
+import sys
+import types
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+qt_names = ["QAbstractItemView", "QAbstractListModel", "QAbstractScrollArea", "QAction", "QApplication", "QButtonGroup",
+            "QCheckBox", "QComboBox", "QDesktopServices", "QDialog", "QHBoxLayout", "QIcon", "QLabel", "QLayout",
+            "QLineEdit", "QListView", "QListWidget", "QListWidgetItem", "QMenu", "QModelIndex", "QPixmap",
+            "QProgressDialog", "QPushButton", "QRadioButton", "QScrollBar", "QSize", "QSizePolicy",
+            "QStyledItemDelegate", "QTimer", "QUrl", "QVBoxLayout", "QWidget", "Qt", "pyqtSignal"]
+
+
+class StubMeta(type):
+    def __getattr__(cls, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return Stub
+
+
+class Stub(metaclass=StubMeta):
+    """Stands in for any aqt/anki/Qt object: can be called, subclassed and have any attribute read."""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __call__(self, *args, **kwargs):
+        return Stub()
+
+    def __getattr__(self, name):
+        return Stub()
+
+    def __or__(self, other):
+        return self
+
+
+class Hooks:
+    """Stands in for aqt.gui_hooks and keeps the callbacks registered on each hook, so that they can be run."""
+
+    def __init__(self):
+        self.registered = {}
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return self.registered.setdefault(name, [])
+
+
+class StubModule(types.ModuleType):
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return Stub
+
+
+def install_stubs():
+    for name in ["anki", "anki.hooks", "anki.notes", "anki.cards", "anki.sound", "aqt", "aqt.utils", "aqt.browser",
+                 "aqt.editor", "aqt.qt", "PyQt5", "PyQt5.QtCore", "PyQt5.QtGui", "PyQt5.QtWidgets"]:
+        module = StubModule(name)
+        module.__path__ = []
+        sys.modules[name] = module
+        parent, _, child = name.rpartition(".")
+        if parent:
+            setattr(sys.modules[parent], child, module)
+    for module in ["aqt.qt", "PyQt5.QtCore", "PyQt5.QtGui", "PyQt5.QtWidgets"]:
+        for name in qt_names:  # so that `from aqt.qt import *` finds them
+            setattr(sys.modules[module], name, Stub)
+    sys.modules["aqt"].mw = Stub()
+    sys.modules["aqt"].gui_hooks = Hooks()
+    sys.modules["anki.hooks"].addHook = lambda *args: None
+
+
+def load_addon(package_name: str) -> types.ModuleType:
+    """Imports the add-on as `package_name` against the stubs, which have to be installed first."""
+    spec = importlib.util.spec_from_file_location(package_name, os.path.join(root, "__init__.py"),
+                                                  submodule_search_locations=[root])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[package_name] = module
+    spec.loader.exec_module(module)
+    return module
@@ -1,112 +1,289 @@
-import os
 import anki
 from typing import List
 from PyQt5.QtWidgets import *
 from PyQt5.QtGui import *
 from PyQt5.QtCore import *
 
-from .Shtooka import Pronunciation
+from .Assets import get_assets
+from .Dedup import Deduplicator
+from .Prefetch import Prefetcher
+from .Pronunciation import Pronunciation, discard_unused
 from .Util import CustomScrollbar
 
 
-class PronunciationWidget(QWidget):
-	def __init__(self, pronunciation: Pronunciation, select_pronunciation, parent=None):
-		from .. import asset_dir
-		super(PronunciationWidget, self).__init__(parent)
-		container = QWidget(self)
-		container.setFixedWidth(450)
-		container.setFixedHeight(100)
-		#container.setStyleSheet("background-color: #F4FAFF; margin: 0; padding: 0; border-radius: 10px")
-		container.setStyleSheet("background-color: #3a3a3a; margin: 0; padding: 0; border-radius: 10px")
-		
-		layout = QHBoxLayout(container)
-		layout.setContentsMargins(30, 10, 30, 10)
-		btn = QPushButton("")
-		btn.setFixedWidth(40)
-		btn.setFixedHeight(40)
-		btn.setIcon(QIcon(os.path.join(asset_dir, "play_button.png")))
-		btn.setIconSize(QSize(40, 40))
-		
-		def play_audio():
-			if pronunciation.audio is None:
-				pronunciation.download_pronunciation()  # Download audio on demand
-			anki.sound.play(pronunciation.audio)
-		
-		btn.clicked.connect(play_audio)
-		
-		layout.addWidget(btn)
-		
-		layout.addSpacing(20)
-		
-		word_info_layout = QVBoxLayout()
-		
-		word = QLabel(pronunciation.word)
-		word_info_layout.addWidget(word)
-		word.setStyleSheet("font-family: Roboto, Arial, sans-serif; font-size: 20px; font-weight: bold; color: #ffffff;")
-		more_info = QLabel(pronunciation.user)
-		more_info.setStyleSheet("font-family: sans-serif; color: #ffffff;")
-		word_info_layout.addWidget(more_info)
-		word_info_layout.setContentsMargins(0, 15, 0, 15)
-		layout.addLayout(word_info_layout)
-		layout.addStretch()
-		
-		btn_select = QPushButton("")
-		btn_select.setFixedWidth(40)
-		btn_select.setFixedHeight(40)
-		btn_select.setIcon(QIcon(os.path.join(asset_dir, "checkmark.png")))
-		btn_select.setIconSize(QSize(40, 40))
-		btn_select.clicked.connect(lambda: select_pronunciation(pronunciation))
-		layout.addWidget(btn_select)
+def describe(pronunciation: Pronunciation) -> str:
+	"""The line below the word: the user, and all sources if several had this recording."""
+	if len(pronunciation.sources) > 1:
+		return "%s · %s" % (pronunciation.user, ", ".join(pronunciation.sources))
+	return pronunciation.user
+
+
+class PronunciationModel(QAbstractListModel):
+	"""The listed pronunciations. Rows only exist as data; PronunciationDelegate paints the visible ones."""
+	def __init__(self, parent=None):
+		super().__init__(parent)
+		self.pronunciations: List[Pronunciation] = []
+	
+	def rowCount(self, parent=QModelIndex()):
+		return 0 if parent.isValid() else len(self.pronunciations)
+	
+	def data(self, index, role=Qt.DisplayRole):
+		if not index.isValid() or index.row() >= len(self.pronunciations):
+			return None
+		pronunciation = self.pronunciations[index.row()]
+		if role == Qt.DisplayRole:
+			return pronunciation.word
+		if role == Qt.ToolTipRole:
+			return describe(pronunciation)
+		if role == Qt.UserRole:
+			return pronunciation
+		return None
+	
+	def append(self, pronunciations: List[Pronunciation]):
+		if not pronunciations:
+			return
+		first = len(self.pronunciations)
+		self.beginInsertRows(QModelIndex(), first, first + len(pronunciations) - 1)
+		self.pronunciations += pronunciations
+		self.endInsertRows()
+	
+	def row_of(self, pronunciation: Pronunciation) -> int:
+		return next((i for i, p in enumerate(self.pronunciations) if p is pronunciation), -1)
+	
+	def remove(self, pronunciation: Pronunciation):
+		row = self.row_of(pronunciation)
+		if row < 0:
+			return
+		self.beginRemoveRows(QModelIndex(), row, row)
+		del self.pronunciations[row]
+		self.endRemoveRows()
+	
+	def refresh(self, pronunciation: Pronunciation):
+		"""Repaints the row of `pronunciation`, e.g. after it got the sources of a duplicate."""
+		row = self.row_of(pronunciation)
+		if row >= 0:
+			index = self.index(row)
+			self.dataChanged.emit(index, index)
+
+
+class PronunciationDelegate(QStyledItemDelegate):
+	"""Paints a row as a card with a play button, the word, its user and a select button, and does the hit-testing
+	for both buttons itself, so no widgets are created per row."""
+	play = pyqtSignal(object)
+	select = pyqtSignal(object)
+	
+	# Geometry of a row: a card of card_width x card_height with `margin` above and left of it
+	margin = 15
+	card_width = 450
+	card_height = 100
+	padding = 30
+	button_size = 40
+	
+	def __init__(self, parent=None):
+		super().__init__(parent)
+		assets = get_assets()
+		self.play_icon = assets.icon("play_button.png")
+		self.select_icon = assets.icon("checkmark.png")
+		self.word_font = QFont("Roboto")
+		self.word_font.setStyleHint(QFont.SansSerif)  # Arial or whatever sans-serif font there is without Roboto
+		self.word_font.setPixelSize(20)
+		self.word_font.setBold(True)
+		self.info_font = QFont()
+		self.info_font.setStyleHint(QFont.SansSerif)
+	
+	def sizeHint(self, option, index):
+		return QSize(self.margin * 2 + self.card_width, self.margin + self.card_height)
+	
+	def card_rect(self, rect: QRect) -> QRect:
+		return QRect(rect.left() + self.margin, rect.top() + self.margin, self.card_width, self.card_height)
+	
+	def play_rect(self, rect: QRect) -> QRect:
+		card = self.card_rect(rect)
+		return QRect(card.left() + self.padding, card.center().y() - self.button_size // 2, self.button_size, self.button_size)
+	
+	def select_rect(self, rect: QRect) -> QRect:
+		card = self.card_rect(rect)
+		return QRect(card.right() - self.padding - self.button_size, card.center().y() - self.button_size // 2,
+					 self.button_size, self.button_size)
+	
+	def paint(self, painter, option, index):
+		pronunciation = index.data(Qt.UserRole)
+		if pronunciation is None:
+			return
+		painter.save()
+		painter.setRenderHint(QPainter.Antialiasing)
+		card = self.card_rect(option.rect)
+		painter.setPen(Qt.NoPen)
+		painter.setBrush(QColor("#3a3a3a"))
+		painter.drawRoundedRect(card, 10, 10)
+		self.play_icon.paint(painter, self.play_rect(option.rect))
+		self.select_icon.paint(painter, self.select_rect(option.rect))
 		
-		vbox = QVBoxLayout()
-		vbox.addWidget(container)
-		vbox.setContentsMargins(15, 15, 15, 0)
-		self.setLayout(vbox)
+		text_left = self.play_rect(option.rect).right() + 1 + 20
+		text_width = self.select_rect(option.rect).left() - text_left - 10
+		painter.setPen(QColor("#ffffff"))
+		painter.setFont(self.word_font)
+		word_rect = QRect(text_left, card.top() + 15, text_width, card.height() // 2 - 15)
+		painter.drawText(word_rect, Qt.AlignLeft | Qt.AlignBottom,
+						 QFontMetrics(self.word_font).elidedText(pronunciation.word, Qt.ElideRight, text_width))
+		painter.setFont(self.info_font)
+		info_rect = QRect(text_left, card.center().y() + 4, text_width, card.height() // 2 - 19)
+		painter.drawText(info_rect, Qt.AlignLeft | Qt.AlignTop,
+						 QFontMetrics(self.info_font).elidedText(describe(pronunciation), Qt.ElideRight, text_width))
+		painter.restore()
+	
+	def editorEvent(self, event, model, option, index):
+		if event.type() not in (QEvent.MouseButtonRelease, QEvent.MouseMove):
+			return False
+		on_play = self.play_rect(option.rect).contains(event.pos())
+		on_select = self.select_rect(option.rect).contains(event.pos())
+		if event.type() == QEvent.MouseMove:
+			if option.widget is not None:
+				option.widget.viewport().setCursor(Qt.PointingHandCursor if on_play or on_select else Qt.ArrowCursor)
+			return False
+		if event.button() != Qt.LeftButton:
+			return False
+		pronunciation = index.data(Qt.UserRole)
+		if on_play:
+			self.play.emit(pronunciation)
+			return True
+		if on_select:
+			self.select.emit(pronunciation)
+			return True
+		return False
 
 
 class AddSingle(QDialog):
-	def __init__(self, parent, pronunciations: List[Pronunciation], hidden_entries_amount):
+	"""Opens right away and gets filled with rows as the sources respond. `sources` are the names of the sources that
+	are still being queried; each gets a status row until its results arrive via add_results().
+	Recordings that more than one source has are only listed once, see Dedup.py."""
+	fetched = pyqtSignal(object, str)
+	
+	def __init__(self, parent, pronunciations: List[Pronunciation], hidden_entries_amount, sources: List[str] = None):
 		super().__init__(parent)
 		self.selected_pronunciation: Pronunciation = None
+		self.hidden_entries_amount = hidden_entries_amount
+		self.pending_sources = list(sources or [])
+		self.closed = False
+		self.dedup = Deduplicator()
+		self.fetched.connect(self.on_fetched)
+		self.prefetcher = Prefetcher(on_fetched=self.fetched.emit)
 		self.layout = QVBoxLayout()
 		self.setLayout(self.layout)
-		self.description = "<h1>audio-dl</h1><p>Please select the audio you want to add.</p>"
 		#self.setStyleSheet("font-family: sans-serif;")
 		#self.description = "<h1>audio-dl</h1><p>Please select the audio you want to add.</p><p><small>You can hold down the shift key when clicking on the forvo <br/> button in the editor to automatically select the top pronunciation.</small></p>"
 		
-		if hidden_entries_amount > 0:
-			self.description += f"<b><small>There are {hidden_entries_amount} more entries which you chose to hide by deactivating .ogg fallback.</small></b>"
-		self.description_label = QLabel(text=self.description)
+		self.description_label = QLabel()
 		self.description_label.setAlignment(Qt.AlignCenter)
 		self.layout.addWidget(self.description_label)
 		
-		# Create the list
-		pronunciation_list = QListWidget()
-		pronunciation_list.setStyleSheet("border: none; background-color: #2f2f31;")
-		# Add to list a new item (item is simply an entry in your list)
+		# One status row per source that is still loading or failed
+		self.status_labels = {}
+		status_layout = QVBoxLayout()
+		for source in self.pending_sources:
+			label = QLabel("<small>%s: loading...</small>" % source)
+			label.setAlignment(Qt.AlignCenter)
+			self.status_labels[source] = label
+			status_layout.addWidget(label)
+		self.layout.addLayout(status_layout)
 		
-		for pronunciation in pronunciations:
-			item = QListWidgetItem(pronunciation_list)
-			item.setFlags(item.flags() & ~Qt.ItemIsEnabled)
-			# Instanciate a custom widget
-			item_widget = PronunciationWidget(pronunciation, select_pronunciation=self.select_pronunciation)
-			item.setSizeHint(item_widget.minimumSizeHint())
-			# Associate the custom widget to the list entry
-			pronunciation_list.setItemWidget(item, item_widget)
+		# Create the list. Only the visible rows get painted, so opening takes the same time for any number of results
+		self.model = PronunciationModel(self)
+		self.delegate = PronunciationDelegate(self)
+		self.delegate.play.connect(self.play_pronunciation)
+		self.delegate.select.connect(self.select_pronunciation)
+		self.pronunciation_list = QListView()
+		self.pronunciation_list.setModel(self.model)
+		self.pronunciation_list.setItemDelegate(self.delegate)
+		self.pronunciation_list.setUniformItemSizes(True)
+		self.pronunciation_list.viewport().setMouseTracking(True)  # for the hand cursor over the buttons
+		self.pronunciation_list.setStyleSheet("border: none; background-color: #2f2f31;")
 		
-		pronunciation_list.setFixedWidth(480)
-		pronunciation_list.setMinimumHeight(500)
-		pronunciation_list.setVerticalScrollBar(CustomScrollbar())
-		pronunciation_list.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
-		pronunciation_list.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
-		pronunciation_list.setSelectionMode(QAbstractItemView.NoSelection)
+		self.add_rows(pronunciations)
+		
+		self.pronunciation_list.setFixedWidth(480)
+		self.pronunciation_list.setMinimumHeight(500)
+		self.pronunciation_list.setVerticalScrollBar(CustomScrollbar())
+		self.pronunciation_list.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+		self.pronunciation_list.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
+		self.pronunciation_list.setSelectionMode(QAbstractItemView.NoSelection)
 		self.setMaximumHeight(1000)
 		
-		self.layout.addWidget(pronunciation_list)
+		self.layout.addWidget(self.pronunciation_list)
+		self.update_description()
 		self.adjustSize()
 	
+	def update_description(self):
+		description = "<h1>audio-dl</h1>"
+		if self.model.rowCount() == 0 and not self.pending_sources:
+			description += "<p>No results found! :(</p>"
+		else:
+			description += "<p>Please select the audio you want to add.</p>"
+		if self.hidden_entries_amount > 0:
+			description += f"<b><small>There are {self.hidden_entries_amount} more entries which you chose to hide by deactivating .ogg fallback.</small></b>"
+		self.description_label.setText(description)
+	
+	def add_rows(self, pronunciations: List[Pronunciation]):
+		if self.closed:
+			discard_unused(pronunciations)  # results of sources that answered after the dialog was closed
+			return
+		unique = self.dedup.add(pronunciations)
+		unique_ids = {id(pronunciation) for pronunciation in unique}
+		for pronunciation in pronunciations:
+			if id(pronunciation) not in unique_ids:  # the row that is already listed now names one more source
+				self.model.refresh(self.dedup.find(pronunciation))
+		self.model.append(unique)
+		for pronunciation in unique:
+			self.prefetcher.add(pronunciation)
+	
+	def on_fetched(self, pronunciation: Pronunciation, digest: str):
+		"""Called on the main thread for every prefetched file. Different URLs with the same audio become one row."""
+		kept = self.dedup.add_content(pronunciation, digest)
+		if kept is None:
+			return
+		self.model.remove(pronunciation)
+		self.model.refresh(kept)
+	
+	def add_results(self, source: str, pronunciations: List[Pronunciation], error: Exception = None, hidden_entries_amount: int = 0):
+		"""Called on the main thread whenever a source has finished."""
+		if source in self.pending_sources:
+			self.pending_sources.remove(source)
+		self.hidden_entries_amount += hidden_entries_amount
+		label = self.status_labels.get(source)
+		if label is not None:
+			if error is not None:
+				label.setText("<small>%s: failed (%s)</small>" % (source, getattr(error, "friendly", type(error).__name__)))
+			else:
+				label.hide()
+		self.add_rows(pronunciations)
+		self.update_description()
+	
+	def done(self, result):
+		"""Stops prefetching when the dialog gets closed; only the selected audio is still needed."""
+		keep = [self.selected_pronunciation.download_url] if self.selected_pronunciation is not None else []
+		self.prefetcher.cancel(keep=[url for url in keep if isinstance(url, str)])
+		self.closed = True
+		super().done(result)
+	
+	def discard_unused(self):
+		"""Removes the spooled audio of every listed pronunciation except the selected one."""
+		discard_unused(self.model.pronunciations, self.selected_pronunciation)
+	
+	def play_pronunciation(self, pronunciation: Pronunciation):
+		"""Audio that wasn't prefetched gets downloaded (and maybe converted) in the background, like on selection."""
+		from .Tasks import BackgroundTask
+		if pronunciation.audio is not None:
+			anki.sound.play(pronunciation.audio)
+			return
+		
+		def on_downloaded(_):
+			if not self.closed:
+				anki.sound.play(pronunciation.audio)
+		
+		BackgroundTask(self, pronunciation.mw, "Downloading audio...", lambda cancelled: pronunciation.download_pronunciation(),
+					   on_downloaded).start()
+	
 	def select_pronunciation(self, pronunciation: Pronunciation):
+		"""The download happens in the background once the dialog is closed."""
 		self.selected_pronunciation = pronunciation
-		if pronunciation.audio is None:
-			pronunciation.download_pronunciation()
 		self.close()
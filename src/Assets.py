@@ -0,0 +1,77 @@
+import base64
+import json
+import mimetypes
+import os
+import threading
+from typing import Dict, List, Union
+
+
+class CodeTable:
+    """A table from assets/ (languages.json, countries.json) with its entries indexed by code and by name."""
+
+    def __init__(self, records: List[Dict[str, str]], code_key: str, name_key: str):
+        self.records = records
+        self.name_by_code: Dict[str, str] = {record[code_key]: record[name_key] for record in records}
+        self.code_by_name: Dict[str, str] = {record[name_key]: record[code_key] for record in records}
+        self.index_by_code: Dict[str, int] = {record[code_key]: i for i, record in enumerate(records)}
+
+
+class AssetRegistry:
+    """Icons, data URIs and the language and country tables of assets/. Each of them is read from disk the first
+    time it is asked for and then kept for as long as Anki runs, so opening editors and dialogs again doesn't touch
+    the disk. Icons must only be asked for on the main thread."""
+
+    def __init__(self, asset_dir: str):
+        self.asset_dir = asset_dir
+        self._icons = {}
+        self._data_uris: Dict[str, str] = {}
+        self._tables: Dict[str, CodeTable] = {}
+        self._lock = threading.Lock()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.asset_dir, name)
+
+    def icon(self, name: str):
+        """A QIcon of an image in assets/."""
+        from PyQt5.QtGui import QIcon
+        icon = self._icons.get(name)
+        if icon is None:
+            icon = self._icons[name] = QIcon(self.path(name))
+        return icon
+
+    def data_uri(self, name: str) -> str:
+        """An image in assets/ as a data: URI, like editor.resourceToData() makes it."""
+        with self._lock:
+            uri = self._data_uris.get(name)
+            if uri is None:
+                mime = mimetypes.guess_type(name)[0] or "application/octet-stream"
+                with open(self.path(name), "rb") as f:
+                    uri = self._data_uris[name] = "data:%s;base64,%s" % (mime, base64.b64encode(f.read()).decode("ascii"))
+            return uri
+
+    @property
+    def languages(self) -> CodeTable:
+        return self._table("languages.json", "Code", "English name")
+
+    @property
+    def countries(self) -> CodeTable:
+        return self._table("countries.json", "Code", "Name")
+
+    def _table(self, name: str, code_key: str, name_key: str) -> CodeTable:
+        with self._lock:
+            table = self._tables.get(name)
+            if table is None:
+                with open(self.path(name), encoding="utf8") as f:
+                    table = self._tables[name] = CodeTable(json.load(f), code_key, name_key)
+            return table
+
+
+_assets: Union[AssetRegistry, None] = None
+
+
+def get_assets() -> AssetRegistry:
+    global _assets
+    if _assets is None:
+        from .. import asset_dir
+        _assets = AssetRegistry(asset_dir)
+    return _assets
@@ -0,0 +1,107 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import Union
+
+from aqt import AnkiQt
+
+from .Util import log_debug
+
+
+def hash_file(path: str) -> str:
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()
+
+
+class AudioStore:
+    """Content-addressed index of the audio files that were already added to the collection.
+    URLs map to the hash of the file they delivered, and hashes map to the media filename per media folder, so that
+    the same recording is only ever downloaded and written once, no matter which note or source asks for it."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Union[sqlite3.Connection, None] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, hash TEXT NOT NULL)")
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS blobs (
+                media_dir TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                media_name TEXT NOT NULL,
+                PRIMARY KEY (media_dir, hash))""")
+            self._conn.commit()
+        return self._conn
+
+    @staticmethod
+    def _media_dir(mw: AnkiQt) -> str:
+        return mw.col.media.dir()
+
+    def _existing_media_name(self, conn: sqlite3.Connection, media_dir: str, content_hash: str) -> Union[str, None]:
+        """Returns the filename a blob was stored under, as long as the file is still in the media folder."""
+        row = conn.execute("SELECT media_name FROM blobs WHERE media_dir = ? AND hash = ?", (media_dir, content_hash)).fetchone()
+        if row is None:
+            return None
+        if not os.path.isfile(os.path.join(media_dir, row[0])):
+            conn.execute("DELETE FROM blobs WHERE media_dir = ? AND hash = ?", (media_dir, content_hash))
+            conn.commit()
+            return None
+        return row[0]
+
+    def lookup_url(self, mw: AnkiQt, url: str) -> Union[str, None]:
+        """Returns the media filename of a URL that was downloaded before, or None if it has to be fetched."""
+        media_dir = self._media_dir(mw)
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT hash FROM urls WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                return None
+            media_name = self._existing_media_name(conn, media_dir, row[0])
+        if media_name is not None:
+            log_debug("[AudioStore.py] Reusing %s for %s", media_name, url)
+        return media_name
+
+    def lookup_content(self, mw: AnkiQt, data: bytes) -> Union[str, None]:
+        """Returns the media filename of audio that is already in the collection with exactly these bytes."""
+        media_dir = self._media_dir(mw)
+        with self._lock:
+            return self._existing_media_name(self._connect(), media_dir, hash_bytes(data))
+
+    def add_file(self, mw: AnkiQt, path: str, url: str = None) -> str:
+        """Adds a downloaded file to the collection unless a file with the same content already is in there.
+        Returns the media filename either way."""
+        media_dir = self._media_dir(mw)
+        content_hash = hash_file(path)
+        with self._lock:
+            conn = self._connect()
+            if url is not None:
+                conn.execute("INSERT OR REPLACE INTO urls VALUES (?, ?)", (url, content_hash))
+                conn.commit()
+            media_name = self._existing_media_name(conn, media_dir, content_hash)
+        if media_name is not None:
+            log_debug("[AudioStore.py] %s is already in the collection as %s", path, media_name)
+            return media_name
+
+        media_name = mw.col.media.add_file(path)
+        with self._lock:
+            conn = self._connect()
+            conn.execute("INSERT OR REPLACE INTO blobs VALUES (?, ?, ?)", (media_dir, content_hash, media_name))
+            conn.commit()
+        return media_name
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,238 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from functools import partial
+from typing import Dict, List, Tuple, Union
+
+from anki.cards import Card
+from anki.notes import Note
+from aqt.browser import Browser
+from aqt.utils import showInfo
+from bs4 import BeautifulSoup
+
+from .Config import Config, ConfigObject, OptionType
+from .Exceptions import NoResultsException, DownloadCancelledException, FieldNotFoundException, KnownMissException
+from .FailedDownloadsDialog import FailedDownloadsDialog
+from .FieldSelector import FieldSelector
+from .Http import cancel_on, get_transport
+from .LanguageSelector import LanguageSelector
+from .Lookup import get_executor, lookup_pronunciations, tasks_per_lookup
+from .Pronunciation import discard_unused
+from .Trace import span, tracer
+from .Transcode import get_format, get_shrink_bitrate, get_transcoder, skip_ogg
+from .Util import FailedDownload, add_audio_string, log_debug
+
+bulk_workers = 4  # notes that get looked up and downloaded at the same time
+write_batch_size = 50  # notes that get written to the collection at once
+
+
+@dataclass
+class BulkJob:
+    note_id: int
+    note: Note
+    card: Card
+    query: str
+    language: str
+    audio_field: str
+
+
+class BulkAdd:
+    """Adds audio to all notes selected in the browser. Lookups and downloads run on a bounded worker pool in the
+    background, the top pronunciation gets selected automatically (like shift-clicking the editor button) and the
+    notes are written back to the collection in batches."""
+
+    def __init__(self, browser: Browser, config: Config):
+        self.browser = browser
+        self.mw = browser.mw
+        self.config = config
+        self.failed: List[FailedDownload] = []
+        self.skipped = 0
+        self.known_misses = 0  # notes that weren't looked up because none of the sources had audio recently
+        self.throttled: Dict[str, float] = {}  # seconds each host was waited for because of rate limits
+        self.shrunk: Tuple[int, int] = (0, 0)  # files trimmed and re-encoded, bytes that saved
+        self.added = 0
+        self.cancelled = threading.Event()
+        self.trace = None
+
+    def start(self):
+        note_ids = self.browser.selected_notes()
+        if not note_ids:
+            showInfo("Please select the notes you want to add audio to.", self.browser)
+            return
+        jobs = self.prepare_jobs(note_ids)
+        if jobs is None:
+            return
+        if not jobs:
+            self.show_summary()
+            return
+
+        log_debug("[BulkAdd.py] Starting bulk add for %d notes", len(jobs))
+        get_transport().limiter.reset_report()
+        if get_shrink_bitrate(self.config) is not None:
+            get_transcoder(self.config).reset_report()
+        self.trace = tracer.start_trace("bulk add", notes=len(jobs))
+        self.mw.progress.start(max=len(jobs), label="Adding audio...", parent=self.browser, immediate=True)
+        self.mw.taskman.run_in_background(partial(self.run_jobs, jobs), self.on_done)
+
+    def select_field(self, note_type_id: int, field_type: str) -> Union[str, None]:
+        field = self.config.get_note_type_specific_config_object(field_type, note_type_id)
+        if field is not None:
+            return field.value
+        d = FieldSelector(self.browser, self.mw, note_type_id, field_type, self.config)
+        d.exec()
+        if d.selected_field is None:
+            return None
+        self.config.set_note_type_specific_config_object(
+            ConfigObject(name=field_type, value=d.selected_field, note_type=note_type_id, type=OptionType.TEXT))
+        return d.selected_field
+
+    def select_language(self, deck_id: int) -> Union[str, None]:
+        language = self.config.get_deck_specific_config_object("language", deck_id)
+        if language is not None:
+            return language.value
+        d = LanguageSelector(self.browser, self.mw.col.decks.name(deck_id))
+        d.exec()
+        if d.selected_lang is None:
+            return None
+        self.config.set_deck_specific_config_object(
+            ConfigObject(name="language", value=d.selected_lang, deck=deck_id, type=OptionType.LANG))
+        return d.selected_lang
+
+    def prepare_jobs(self, note_ids: List[int]) -> Union[List[BulkJob], None]:
+        """Reads the selected notes and asks for missing fields and languages once per note type and deck.
+        Returns None if the user cancelled one of those dialogs."""
+        fields: Dict[int, Tuple[str, str]] = {}
+        languages: Dict[int, str] = {}
+        skip_existing = self.config.get_config_object("skipExistingBulkAdd").value
+        jobs = []
+        for note_id in note_ids:
+            note = self.mw.col.get_note(note_id)
+            card = note.cards()[0]
+
+            if note.mid not in fields:
+                search_field = self.select_field(note.mid, "searchField")
+                audio_field = self.select_field(note.mid, "audioField") if search_field is not None else None
+                if search_field is None or audio_field is None:
+                    showInfo("Cancelled bulk add because fields weren't selected.", self.browser)
+                    return None
+                fields[note.mid] = (search_field, audio_field)
+            search_field, audio_field = fields[note.mid]
+
+            if card.did not in languages:
+                language = self.select_language(card.did)
+                if language is None:
+                    showInfo("Cancelled bulk add because no language was selected.", self.browser)
+                    return None
+                languages[card.did] = language
+
+            if search_field not in note.keys():
+                self.failed.append(FailedDownload(card, FieldNotFoundException(search_field)))
+                continue
+            if skip_existing and audio_field in note.keys() and len(note[audio_field].strip()) != 0:
+                self.skipped += 1
+                continue
+            query = BeautifulSoup(note[search_field], "html.parser").text
+            if len(query.strip()) == 0:
+                self.failed.append(FailedDownload(card, NoResultsException()))
+                continue
+            jobs.append(BulkJob(note_id, note, card, query, languages[card.did], audio_field))
+        return jobs
+
+    def process_job(self, job: BulkJob) -> str:
+        """Runs on a worker thread: looks up the note's word, picks the top pronunciation and downloads it."""
+        if self.cancelled.is_set():
+            raise DownloadCancelledException()
+        with cancel_on(self.cancelled):  # cancelling also ends waits for rate limits
+            found = lookup_pronunciations(job.query, job.language, self.mw, self.config, job.note)
+            results = [p for p in found if not p.is_ogg] if skip_ogg(self.config) else found
+            top = sorted(results, key=lambda result: result.votes)[-1] if results else None  # most upvoted pronunciation
+            discard_unused(found, top)
+            if top is None:
+                raise NoResultsException()
+            if self.cancelled.is_set():
+                top.discard()
+                raise DownloadCancelledException()
+            top.download_pronunciation()
+        return top.audio
+
+    def run_jobs(self, jobs: List[BulkJob]):
+        done = 0
+        pending_writes: List[Tuple[BulkJob, str]] = []
+        # conversions are CPU bound, so with those there are enough workers to keep every core busy
+        workers = max(bulk_workers, os.cpu_count() or 1) if get_format(self.config) is not None else bulk_workers
+        get_executor(workers * tasks_per_lookup)  # enough lookup threads that no note's sources wait for another's
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="audio-dl-bulk") as pool:
+            futures = {pool.submit(self.trace.bind(self.process_job), job): job for job in jobs}
+            for future in as_completed(futures):
+                job = futures[future]
+                try:
+                    pending_writes.append((job, future.result()))
+                except Exception as e:
+                    log_debug("[BulkAdd.py] Failed for note %s: %r", job.note_id, e)
+                    self.failed.append(FailedDownload(job.card, e))
+                    if isinstance(e, KnownMissException):
+                        self.known_misses += 1
+                done += 1
+                if len(pending_writes) >= write_batch_size:
+                    self.mw.taskman.run_on_main(partial(self.write_fields, pending_writes))
+                    pending_writes = []
+                self.mw.taskman.run_on_main(partial(self.update_progress, done, len(jobs)))
+        if pending_writes:
+            self.mw.taskman.run_on_main(partial(self.write_fields, pending_writes))
+
+    def write_fields(self, batch: List[Tuple[BulkJob, str]]):
+        """Runs on the main thread: puts the downloaded audio into the notes and saves them in one go."""
+        add_mode = self.config.get_config_object("audioFieldAddMode").value
+        notes = []
+        with self.trace.activate(), span("field", notes=len(batch)):
+            for job, audio in batch:
+                note = self.mw.col.get_note(job.note_id)
+                try:
+                    add_audio_string(note, job.audio_field, audio, add_mode)
+                except FieldNotFoundException as e:
+                    self.failed.append(FailedDownload(job.card, e))
+                    continue
+                notes.append(note)
+            self.mw.col.update_notes(notes)
+        self.added += len(notes)
+
+    def update_progress(self, done: int, total: int):
+        if self.mw.progress.want_cancel():
+            self.cancelled.set()
+        self.mw.progress.update(label="Adding audio... (%d/%d)" % (done, total), value=done, max=total)
+
+    def on_done(self, future):
+        self.mw.progress.finish()
+        self.trace.finish()
+        self.throttled = get_transport().limiter.report()
+        for host, seconds in self.throttled.items():
+            log_debug("[BulkAdd.py] Throttled for %.1fs by %s", seconds, host)
+        if get_shrink_bitrate(self.config) is not None:
+            self.shrunk = get_transcoder(self.config).report()
+            log_debug("[BulkAdd.py] Shrunk %d files by %d bytes", *self.shrunk)
+        future.result()
+        self.browser.onSearchActivated()
+        self.show_summary()
+
+    def get_run_report(self) -> List[str]:
+        """What the run saved and waited for, shown whether or not some notes failed."""
+        report = []
+        if self.shrunk[0] > 0:
+            report.append("Trimmed and re-encoded %d files, which saved %.1f MB." % (self.shrunk[0], self.shrunk[1] / 1024 / 1024))
+        slow_hosts = ["%s (%ds)" % (host, seconds) for host, seconds in self.throttled.items() if seconds >= 1]
+        if slow_hosts:
+            report.append("Waited for rate limits of: %s" % ", ".join(slow_hosts))
+        return report
+
+    def show_summary(self):
+        if self.failed:
+            FailedDownloadsDialog(self.browser, self.failed, self.mw, self.config, self.skipped, self.known_misses,
+                                  self.get_run_report()).exec()
+        else:
+            message = "Added audio to %d notes." % self.added
+            if self.skipped > 0:
+                message += " %d notes that already had something in their audio fields were skipped." % self.skipped
+            for line in self.get_run_report():
+                message += "\n\n" + line
+            showInfo(message, self.browser)
@@ -1,8 +1,10 @@
-from typing import List
+from typing import Dict, List, Tuple, Union
 
 import copy
 import json
 import os
+import tempfile
+import threading
 
 from dataclasses import dataclass
 from enum import Enum
@@ -13,22 +15,49 @@ class ConfigObjectHasNoValue(Exception):
         super().__init__("Config object with config option %s has no value and the default value isn't set as fallback" % config_object.name)
 
 
+_missing = object()
+
+"""Seconds changes are collected before config.json gets written"""
+save_delay = 1.0
+
+
 class Config:
-    """Ridiculously over-engineered class that handles all things config."""
+    """Ridiculously over-engineered class that handles all things config.
+
+    Deck and note type specific options are indexed by id, and every ConfigObject handed out is cached until the
+    option gets written, so reading an option doesn't scan or copy anything. Callers that change the value of a
+    returned ConfigObject have to write it back with one of the set_* methods.
+
+    Writes only change the config in memory; config.json gets rewritten `save_delay` seconds after the first
+    unsaved change (or on flush()), so a burst of changes ends up as a single write."""
     config: dict
     template: dict
 
     def __init__(self, config_path: str, template_path: str):
         self.config_path = config_path
         self.template_path = template_path
+        self._decks: Dict[int, dict] = {}
+        self._note_types: Dict[int, dict] = {}
+        self._objects: Dict[Tuple, 'ConfigObject'] = {}
+        self._dirty = False
+        self._timer: Union[threading.Timer, None] = None
+        self._lock = threading.RLock()  # guards self.config against the flush thread
+        self._write_lock = threading.Lock()  # keeps writes in the order the changes were made
+
+    def _reindex(self):
+        """Rebuilds the id indices of the deck and note type sections and drops all cached ConfigObjects."""
+        self._decks = {deck["id"]: deck for deck in self.config.get("deckSpecific", [])}
+        self._note_types = {nt["id"]: nt for nt in self.config.get("noteTypeSpecific", [])}
+        self._objects.clear()
 
     def load_config(self):
         """Loads the config from the file into memory"""
         if not os.path.isfile(self.config_path):
             self.config = dict()
-            return self
-        with open(self.config_path, "r", encoding="utf8") as f:
-            self.config = json.loads(f.read())
+        else:
+            with open(self.config_path, "r", encoding="utf8") as f:
+                self.config = json.loads(f.read())
+        self._reindex()
         return self
 
     def load_template(self):
@@ -38,31 +67,66 @@ class Config:
         return self
 
     def _save(self):
-        """Saves the current config from memory into the file."""
-        with open(self.config_path, "w", encoding="utf8") as f:
-            f.write(json.dumps(self.config, indent=4))
+        """Marks the config as changed. It gets written to the file once `save_delay` has passed."""
+        with self._lock:
+            self._dirty = True
+            if self._timer is None:
+                self._timer = threading.Timer(save_delay, self._flush_later)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _flush_later(self):
+        try:
+            self.flush()
+        except OSError:
+            with self._lock:
+                self._dirty = True  # try again on the next change or when closing
+
+    def flush(self):
+        """Writes unsaved changes to the file right away. The file is replaced atomically, so a crash while writing
+        can't leave a truncated config.json behind."""
+        with self._write_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                if not self._dirty:
+                    return
+                data = json.dumps(self.config, indent=4)
+                self._dirty = False
+            fd, temp_path = tempfile.mkstemp(prefix=".config-", suffix=".tmp", dir=os.path.dirname(self.config_path) or None)
+            try:
+                with os.fdopen(fd, "w", encoding="utf8") as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self.config_path)
+            except BaseException:
+                os.remove(temp_path)
+                raise
 
 
     def ensure_options(self):
-        """Ensures that all options defined in the template are present in the config."""
-        for k, v in self.template.items():
+        """Ensures that all options defined in the template are present in the config. The file is only written if
+        options were missing."""
+        missing = [k for k in self.template.keys() if k not in self.config.keys()]
+        for k in missing:
             if k != "noteTypeSpecific" and k != "deckSpecific":
-                if k not in self.config.keys():
-                    self.config[k] = self.template[k]["default"]
-
-        if "noteTypeSpecific" not in self.config.keys():
-            self.config["noteTypeSpecific"] = []
-
-        if "deckSpecific" not in self.config.keys():
-            self.config["deckSpecific"] = []
-
-        self._save()
+                self.config[k] = self.template[k]["default"]
+            else:
+                self.config[k] = []
+
+        self._reindex()
+        if missing:
+            self._dirty = True
+            self.flush()
         return self
 
     def set_config_object(self, config_object: 'ConfigObject'):
-        self.config[config_object.name] = config_object.value
+        with self._lock:
+            self._objects.pop((None, config_object.name), None)
+            self.config[config_object.name] = config_object.value
         self._save()
-        self.load_config()
 
 
     def get_config_options(self):
@@ -100,85 +164,90 @@ class Config:
 
 
     def get_config_object(self, name) -> 'ConfigObject':
-        return ConfigObject(
-            name,
-            OptionType(self.template[name]["type"]),
-            self.template[name]["friendly"],
-            self.template[name]["description"],
-            self.template[name].get("default", None) or None,
-            self.get_config_options()[name],
-            options=self.template[name]["options"] if OptionType(self.template[name]["type"]) is OptionType.CHOICE else None
-        )
+        key = (None, name)
+        config_object = self._objects.get(key)
+        if config_object is None:
+            template = self.template[name]
+            option_type = OptionType(template["type"])
+            config_object = self._objects[key] = ConfigObject(
+                name,
+                option_type,
+                template["friendly"],
+                template["description"],
+                template.get("default", None) or None,
+                self.config[name],
+                options=template["options"] if option_type is OptionType.CHOICE else None
+            )
+        return config_object
 
     def get_specified_deck_ids(self) -> List[int]:
         """Returns a list of decks that are defined in the config."""
-        return [deck["id"] for deck in self.config["deckSpecific"]]
+        return list(self._decks.keys())
 
     def get_deck_specific_config_object(self, name: str, deck_id: int) -> 'ConfigObject':
-        for deck in self.config["deckSpecific"]:
-            deck: dict
-            if deck["id"] == deck_id:
-                if name in deck.keys():
-                    return ConfigObject(
-                        name,
-                        OptionType(self.template["deckSpecific"][name]["type"]),
-                        self.template["deckSpecific"][name]["friendly"],
-                        self.template["deckSpecific"][name]["description"],
-                        self.template["deckSpecific"][name].get("default", None) or None,
-                        deck[name],
-                        deck=deck_id
-                    )
-                else:
-                    return None
-        return None
+        key = ("deckSpecific", deck_id, name)
+        config_object = self._objects.get(key, _missing)
+        if config_object is _missing:
+            deck = self._decks.get(deck_id)
+            if deck is None or name not in deck:
+                config_object = None
+            else:
+                template = self.template["deckSpecific"][name]
+                config_object = ConfigObject(
+                    name,
+                    OptionType(template["type"]),
+                    template["friendly"],
+                    template["description"],
+                    template.get("default", None) or None,
+                    deck[name],
+                    deck=deck_id
+                )
+            self._objects[key] = config_object
+        return config_object
 
     def get_specified_note_type_ids(self) -> List[int]:
         """Returns a list of note types that are defined in the config."""
-        return [nt["id"] for nt in self.config["noteTypeSpecific"]]
+        return list(self._note_types.keys())
 
     def get_note_type_specific_config_object(self, name: str, note_type_id: int) -> 'ConfigObject':
-        for note_type in self.config["noteTypeSpecific"]:
-            note_type: dict
-            if note_type["id"] == note_type_id:
-                if name in note_type.keys():
-                    return ConfigObject(
-                        name,
-                        OptionType(self.template["noteTypeSpecific"][name]["type"]),
-                        self.template["noteTypeSpecific"][name]["friendly"],
-                        self.template["noteTypeSpecific"][name]["description"],
-                        self.template["noteTypeSpecific"][name].get("default", None) or None,
-                        note_type[name],
-                        note_type=note_type_id
-                    )
-                else:
-                    return None
-        return None
-
-    def set_deck_specific_config_object(self, config_object: 'ConfigObject', use_default_as_fallback=False):
-        existing: list = self.config["deckSpecific"]
-        existing_options_for_deck = copy.deepcopy(next((x for x in existing if x["id"] == config_object.deck), {}))
-        existing = [x for x in existing if x["id"] != config_object.deck]
-        existing_options_for_deck["id"] = config_object.deck
+        key = ("noteTypeSpecific", note_type_id, name)
+        config_object = self._objects.get(key, _missing)
+        if config_object is _missing:
+            note_type = self._note_types.get(note_type_id)
+            if note_type is None or name not in note_type:
+                config_object = None
+            else:
+                template = self.template["noteTypeSpecific"][name]
+                config_object = ConfigObject(
+                    name,
+                    OptionType(template["type"]),
+                    template["friendly"],
+                    template["description"],
+                    template.get("default", None) or None,
+                    note_type[name],
+                    note_type=note_type_id
+                )
+            self._objects[key] = config_object
+        return config_object
+
+    def _set_specific(self, section: str, index: Dict[int, dict], item_id: int, config_object: 'ConfigObject', use_default_as_fallback: bool):
+        """Writes a deck or note type specific option into its entry, creating the entry if needed."""
+        self._objects.pop((section, item_id, config_object.name), None)
         if config_object.value is None and not use_default_as_fallback:
             raise ConfigObjectHasNoValue(config_object)
-        existing_options_for_deck[config_object.name] = config_object.value or config_object.default
-        existing.append(existing_options_for_deck)
-        self.config["deckSpecific"] = existing
+        with self._lock:
+            entry = index.get(item_id)
+            if entry is None:
+                entry = index[item_id] = {"id": item_id}
+                self.config[section].append(entry)
+            entry[config_object.name] = config_object.value or config_object.default
         self._save()
-        self.load_config()
+
+    def set_deck_specific_config_object(self, config_object: 'ConfigObject', use_default_as_fallback=False):
+        self._set_specific("deckSpecific", self._decks, config_object.deck, config_object, use_default_as_fallback)
 
     def set_note_type_specific_config_object(self, config_object: 'ConfigObject', use_default_as_fallback=False):
-        existing: list = self.config["noteTypeSpecific"]
-        existing_options_for_note_type = copy.deepcopy(next((x for x in existing if x["id"] == config_object.note_type), {}))
-        existing = [x for x in existing if x["id"] != config_object.note_type]
-        existing_options_for_note_type["id"] = config_object.note_type
-        if config_object.value is None and not use_default_as_fallback:
-            raise ConfigObjectHasNoValue(config_object)
-        existing_options_for_note_type[config_object.name] = config_object.value or config_object.default
-        existing.append(existing_options_for_note_type)
-        self.config["noteTypeSpecific"] = existing
-        self._save()
-        self.load_config()
+        self._set_specific("noteTypeSpecific", self._note_types, config_object.note_type, config_object, use_default_as_fallback)
 
 
     def get_template(self, option: str, category=None):
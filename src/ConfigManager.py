@@ -1,10 +1,8 @@
-import json
-import os
-
 import aqt
 from PyQt5 import QtCore
 from PyQt5.QtWidgets import QDialog, QVBoxLayout, QLabel, QLayout, QLineEdit, QComboBox, QCheckBox, QHBoxLayout
 
+from .Assets import get_assets
 from .Config import Config, ConfigObject, OptionType
 from .GuiElements import StringListControl
 from .Util import delete_layout_contents
@@ -14,7 +12,6 @@ class ConfigManager(QDialog):
 
     def __init__(self, config: Config):
         """Initializes the window."""
-        from .. import asset_dir
         super().__init__()
 
         self.mw = aqt.mw
@@ -28,11 +25,11 @@ class ConfigManager(QDialog):
         self.setLayout(self.layout)
         self.layout.setSizeConstraint(QLayout.SetFixedSize)
 
-        # Cache language list
-        with open(os.path.join(asset_dir, "languages.json"), encoding="utf8") as f:
-            self.language_list = json.loads(f.read())
-        with open(os.path.join(asset_dir, "countries.json"), encoding="utf8") as f:
-            self.country_list = json.loads(f.read())
+        # Language and country lists, parsed once per session
+        assets = get_assets()
+        self.languages = assets.languages
+        self.language_list = self.languages.records
+        self.country_list = assets.countries.records
 
         # -----------------------------
         # General Column (note-type- and deck-agnostic settings)
@@ -183,7 +180,7 @@ class ConfigManager(QDialog):
             language_select = QComboBox()
             [language_select.addItem(lang["English name"], lang["Code"]) for lang in self.language_list]
             language_select.setEditable(True)
-            language_select.setCurrentIndex(next(i for i, x in enumerate(self.language_list) if x["Code"] == config_object.value))
+            language_select.setCurrentIndex(self.languages.index_by_code[config_object.value])
             language_select.currentIndexChanged.connect(lambda new: self.update_state(option_name, language_select.itemData(new), note_type_id, deck_id))
             layout.addWidget(language_select)
 
@@ -207,6 +204,12 @@ class ConfigManager(QDialog):
             dropdown.currentIndexChanged.connect(lambda new: self.update_state(option_name, new, note_type_id, deck_id))
             dropdown.currentTextChanged.connect(lambda new: self.update_state(option_name, new, note_type_id, deck_id))
 
+    def done(self, result: int):
+        from .Http import apply_host_rates
+        self.config.flush()
+        apply_host_rates(self.config)
+        super().done(result)
+
     def update_state(self, option_name: str, new_value, note_type_id=None, deck_id=None):
         """Based on the arguments passed, this function automatically determines where in the settings to update the
         specified option.   """
@@ -0,0 +1,74 @@
+import hashlib
+import os
+import urllib.parse
+from typing import Dict, List, Union
+
+from .Pronunciation import Pronunciation
+
+"""Ports that say nothing about the resource, dropped from URLs"""
+default_ports = {"http": 80, "https": 443}
+
+
+def canonical_url(url: str) -> str:
+    """A form of `url` that is the same for every way of writing down the same recording: http and https, upper or
+    lower case hosts, www., default ports, different percent-encodings, the order of query parameters and fragments
+    don't matter. Paths of local files are made absolute."""
+    parts = urllib.parse.urlsplit(url)
+    scheme = parts.scheme.lower()
+    if scheme not in default_ports:
+        return os.path.normcase(os.path.abspath(url)) if not scheme or len(scheme) == 1 else url  # C:\... is a path too
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if parts.port is not None and parts.port != default_ports[scheme]:
+        host += ":%d" % parts.port
+    path = urllib.parse.quote(urllib.parse.unquote(parts.path) or "/", safe="/~!$&'()*+,;=:@")
+    query = urllib.parse.urlencode(sorted(urllib.parse.parse_qsl(parts.query, keep_blank_values=True)))
+    return urllib.parse.urlunsplit(("https", host, path, query, ""))
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()
+
+
+class Deduplicator:
+    """Drops pronunciations that are the same recording as one seen before: first by their canonical URL, and once
+    the audio is known, by the hash of its content. The entry that was kept records the sources of all its
+    duplicates in `sources`."""
+
+    def __init__(self):
+        self.by_url: Dict[str, Pronunciation] = {}
+        self.by_content: Dict[str, Pronunciation] = {}
+
+    def add(self, pronunciations: List[Pronunciation]) -> List[Pronunciation]:
+        """Returns the pronunciations that aren't duplicates, in their order."""
+        unique = []
+        for pronunciation in pronunciations:
+            key = canonical_url(pronunciation.download_url)
+            kept = self.by_url.get(key)
+            if kept is None:
+                self.by_url[key] = pronunciation
+                unique.append(pronunciation)
+            else:
+                merge_sources(kept, pronunciation)
+                pronunciation.discard()
+        return unique
+
+    def find(self, pronunciation: Pronunciation) -> Union[Pronunciation, None]:
+        """The entry that was kept for the URL of `pronunciation`."""
+        return self.by_url.get(canonical_url(pronunciation.download_url))
+
+    def add_content(self, pronunciation: Pronunciation, digest: str) -> Union[Pronunciation, None]:
+        """Registers the content hash of a fetched pronunciation. Returns the entry it duplicates, which now also
+        lists its sources, or None if it is the first with this content."""
+        kept = self.by_content.setdefault(digest, pronunciation)
+        if kept is pronunciation:
+            return None
+        merge_sources(kept, pronunciation)
+        return kept
+
+
+def merge_sources(kept: Pronunciation, duplicate: Pronunciation):
+    for source in duplicate.sources:
+        if source not in kept.sources:
+            kept.sources.append(source)
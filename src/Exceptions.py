@@ -3,6 +3,15 @@ class NoResultsException(Exception):
     info = "No pronunciations were found on Forvo for the cards."
 
 
+class KnownMissException(NoResultsException):
+    """None of the sources had anything for the query the last time it was looked up, so it wasn't looked up again."""
+    info = "No pronunciations were found for the cards recently, so they weren't looked up again."
+
+    def __init__(self, source_name: str):
+        super().__init__(source_name)
+        self.specific_info = source_name
+
+
 class FieldNotFoundException(Exception):
     friendly = "Field not found"
     info = "A field couldn't be found."
@@ -17,4 +26,13 @@ class DownloadCancelledException(Exception):
     info = "These pronunciations couldn't be downloaded because the download was cancelled."
 
 
-all_errors = [NoResultsException, FieldNotFoundException]
+class LookupTimeoutException(Exception):
+    friendly = "Lookup timed out"
+    info = "The sources didn't respond in time."
+
+    def __init__(self, source_name: str):
+        super().__init__(source_name)
+        self.specific_info = source_name
+
+
+all_errors = [NoResultsException, FieldNotFoundException, LookupTimeoutException, DownloadCancelledException]
@@ -0,0 +1,204 @@
+"""Pulls the result entries out of the search pages of the HTML-based sources.
+
+Every source has one extractor per parser backend. The fastest installed backend gets used: selectolax, then lxml,
+and BeautifulSoup with a SoupStrainer as the fallback, which only builds the tree for the tags that hold results.
+All extractors return the same list of plain dicts, so the sources don't care which backend ran."""
+import re
+from typing import Callable, Dict, List, Tuple, Union
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+try:
+    from selectolax.lexbor import LexborHTMLParser as HTMLParser
+except ImportError:
+    try:
+        from selectolax.parser import HTMLParser
+    except ImportError:
+        HTMLParser = None
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+
+def _available_backends() -> List[str]:
+    backends = []
+    if HTMLParser is not None:
+        backends.append("selectolax")
+    if lxml is not None:
+        backends.append("lxml")
+    backends.append("soup")
+    return backends
+
+
+available_backends = _available_backends()
+default_backend = available_backends[0]
+
+extractors: Dict[Tuple[str, str], Callable[[Union[bytes, str]], List[dict]]] = {}
+
+
+def extractor(source: str, backend: str):
+    """Registers an extractor for a source and backend."""
+    def register(fn):
+        extractors[(source, backend)] = fn
+        return fn
+    return register
+
+
+def extract(source: str, page: Union[bytes, str], backend: str = None) -> List[dict]:
+    return extractors[(source, backend or default_backend)](page)
+
+
+def _krdict_record(subtitle: str, meaning: str, href: str) -> dict:
+    return {
+        "subtitle": subtitle.strip() + ' - ' + meaning.replace('1.', '').strip().split(';')[0],
+        "url": href.replace('javascript:fnSoundPlay(\'', '').replace('\');', ''),
+    }
+
+
+def _shtooka_player_record(title: str, onclick: str, headword: str) -> dict:
+    return {
+        "subtitle": title,
+        "url": onclick.split('\'')[5].replace("http://", "https://"),
+        "headword": headword.strip(),
+    }
+
+
+def _shtooka_sound_record(top: str, href: str, bottom: str) -> dict:
+    return {
+        "subtitle": top.replace("\n", "").replace("\t", ""),
+        "url": href.replace("http://", "https://"),
+        "headword": re.sub(r'(«\s)|(\s»)', '', re.sub(r'[\t\n]', '', bottom).strip()),
+    }
+
+
+# -----------------------------
+# selectolax
+# -----------------------------
+def _selectolax_text_without_links(node) -> str:
+    """Text of a node, leaving out everything inside its <a> tags."""
+    return "".join(child.text(deep=True) if child.tag != "a" else "" for child in node.iter(include_text=True))
+
+
+@extractor("Krdict", "selectolax")
+def _krdict_selectolax(page):
+    tree = HTMLParser(page)
+    records = []
+    for sub in tree.css("span.search_sub"):
+        subtitle = _selectolax_text_without_links(sub)
+        dd = sub.parent.parent.css_first("dd")
+        for link in sub.css("a"):
+            records.append(_krdict_record(subtitle, dd.text() if dd is not None else "", link.attributes.get("href") or ""))
+    return records
+
+
+@extractor("Shtooka", "selectolax")
+def _shtooka_selectolax(page):
+    tree = HTMLParser(page)
+    if any((h2.text() or "").startswith('Matching recordings:') for h2 in tree.css("h2")):
+        return [_shtooka_sound_record(sound.css_first("div.sound_top span").text(),
+                                      sound.css_first("div.sound_top div.download ul a").attributes.get("href"),
+                                      sound.css_first("div.sound_bottom").text())
+                for sound in tree.css("div.sound")]
+    return [_shtooka_player_record(img.attributes.get("title"), img.attributes.get("onclick"), img.parent.text())
+            for img in tree.css("h1.nice img.player_mini")]
+
+
+@extractor("JapanesePod101Alt", "selectolax")
+def _jp101alt_selectolax(page):
+    tree = HTMLParser(page)
+    return [{"subtitle": row.css_first(".dc-vocab_kana").text(),
+             "url": row.css_first(".dc-result-row__player-field > div > audio > source").attributes.get("src")}
+            for row in tree.css('div[class="dc-box--white dc-result-row"]')]
+
+
+# -----------------------------
+# lxml
+# -----------------------------
+def _lxml_parse(page):
+    if isinstance(page, bytes):
+        return lxml.html.fromstring(page, parser=lxml.html.HTMLParser(encoding="utf-8"))
+    return lxml.html.fromstring(page)
+
+
+def _lxml_text_without_links(node) -> str:
+    parts = [node.text or ""]
+    for child in node:
+        if child.tag != "a":
+            parts.append(child.text_content())
+        parts.append(child.tail or "")
+    return "".join(parts)
+
+
+@extractor("Krdict", "lxml")
+def _krdict_lxml(page):
+    tree = _lxml_parse(page)
+    records = []
+    for sub in tree.xpath('//span[contains(concat(" ", normalize-space(@class), " "), " search_sub ")]'):
+        subtitle = _lxml_text_without_links(sub)
+        dd = sub.getparent().getparent().find(".//dd")
+        for link in sub.iter("a"):
+            records.append(_krdict_record(subtitle, dd.text_content() if dd is not None else "", link.get("href") or ""))
+    return records
+
+
+@extractor("Shtooka", "lxml")
+def _shtooka_lxml(page):
+    tree = _lxml_parse(page)
+    if any(h2.text_content().startswith('Matching recordings:') for h2 in tree.iter("h2")):
+        return [_shtooka_sound_record(sound.xpath('.//div[@class="sound_top"]/span')[0].text_content(),
+                                      sound.xpath('.//div[@class="sound_top"]//div[@class="download"]/ul//a')[0].get("href"),
+                                      sound.xpath('.//div[@class="sound_bottom"]')[0].text_content())
+                for sound in tree.xpath('//div[@class="sound"]')]
+    return [_shtooka_player_record(img.get("title"), img.get("onclick"), img.getparent().text_content())
+            for img in tree.xpath('//h1[@class="nice"]//img[@class="player_mini"]')]
+
+
+@extractor("JapanesePod101Alt", "lxml")
+def _jp101alt_lxml(page):
+    tree = _lxml_parse(page)
+    return [{"subtitle": row.xpath('.//*[@class="dc-vocab_kana"]')[0].text_content(),
+             "url": row.xpath('.//*[@class="dc-result-row__player-field"]/div/audio/source')[0].get("src")}
+            for row in tree.xpath('//*[@class="dc-box--white dc-result-row"]')]
+
+
+# -----------------------------
+# BeautifulSoup with SoupStrainer
+# -----------------------------
+def _soup_text_without_links(node) -> str:
+    return "".join(child.get_text() if child.name is not None else str(child) for child in node.children if child.name != "a")
+
+
+@extractor("Krdict", "soup")
+def _krdict_soup(page):
+    # Only the <dl> entries hold results; the huge filter form never gets built
+    html = BeautifulSoup(page, "html.parser", parse_only=SoupStrainer("dl"))
+    records = []
+    for sub in html.find_all("span", class_="search_sub"):
+        subtitle = _soup_text_without_links(sub)
+        dd = sub.find_parent().find_parent().dd
+        for link in sub.find_all("a"):
+            records.append(_krdict_record(subtitle, dd.get_text() if dd is not None else "", link.get('href') or ""))
+    return records
+
+
+@extractor("Shtooka", "soup")
+def _shtooka_soup(page):
+    html = BeautifulSoup(page, "html.parser", parse_only=SoupStrainer(["h1", "h2"]))
+    if any(h2.get_text().startswith('Matching recordings:') for h2 in html.find_all("h2")):
+        html = BeautifulSoup(page, "html.parser", parse_only=SoupStrainer("div", class_="sound"))
+        return [_shtooka_sound_record(sound.find("div", class_="sound_top").span.get_text(),
+                                      sound.find("div", class_="sound_top").find("div", class_="download").ul.find("a").get('href'),
+                                      sound.find("div", class_="sound_bottom").get_text())
+                for sound in html.find_all("div", class_="sound")]
+    return [_shtooka_player_record(img.get('title'), img.get('onclick'), img.find_parent().get_text())
+            for h1 in html.find_all("h1", class_="nice") for img in h1.find_all("img", class_="player_mini")]
+
+
+@extractor("JapanesePod101Alt", "soup")
+def _jp101alt_soup(page):
+    html = BeautifulSoup(page, "html.parser", parse_only=SoupStrainer(class_='dc-box--white dc-result-row'))
+    return [{"subtitle": row.find(class_='dc-vocab_kana').get_text(),
+             "url": row.find(class_='dc-result-row__player-field').div.audio.source.get('src')}
+            for row in html.find_all(class_='dc-box--white dc-result-row')]
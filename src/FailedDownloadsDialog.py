@@ -43,7 +43,7 @@ class FailedListWidgetItemWidget(QWidget):
 
 class FailedDownloadsDialog(QDialog):
 
-    def __init__(self, parent, failed, mw, config: Config, skipped_cards: int):
+    def __init__(self, parent, failed, mw, config: Config, skipped_cards: int, known_misses: int = 0, run_report: List[str] = None):
         from .. import log_dir
         super().__init__(parent)
 
@@ -57,6 +57,10 @@ class FailedDownloadsDialog(QDialog):
         self.description = "<h2>%s Download%s Failed</h2>" % (str(len(self.failed)), "s" if len(self.failed) != 1 else "")
         if skipped_cards > 0:
             self.description += "%s cards that already had something in their audio fields were skipped." % str(skipped_cards)
+        if known_misses > 0:
+            self.description += " %s cards weren't looked up again because no audio was found for them recently." % str(known_misses)
+        for line in run_report or []:
+            self.description += "<p>%s</p>" % line
         self.description_label = QLabel(text=self.description)
         self.description_label.setMinimumSize(self.sizeHint())
         self.description_label.setMinimumHeight(100)
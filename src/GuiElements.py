@@ -1,15 +1,12 @@
 from functools import partial
 
 from PyQt5.QtCore import QSize
-from PyQt5.QtGui import QIcon
 from PyQt5.QtWidgets import QLayout, QDialog, QPushButton, QVBoxLayout, QWidget, QHBoxLayout, QLineEdit, QLabel, \
     QComboBox
 
 from .Config import ConfigObject
 from .Util import delete_layout_contents
 
-import os
-
 
 class ControlElement:
     def __init__(self, option_name: str, config_object: ConfigObject, outer_layout: QLayout, dialog: QDialog, update_callback):
@@ -49,7 +46,8 @@ class ControlElement:
         h_layout.addWidget(self.edit_control)
 
     def render_entries(self):
-        from .. import asset_dir
+        from .Assets import get_assets
+        assets = get_assets()
         for item in self.state:
             h_layout = QHBoxLayout()
             if len(item) == 0:  # is editing
@@ -60,7 +58,7 @@ class ControlElement:
                 h_layout.addWidget(label)
 
             btn = QPushButton("")
-            btn.setIcon(QIcon(os.path.join(asset_dir, "checkmark-1.png" if len(item) == 0 else "trashcan.png")))
+            btn.setIcon(assets.icon("checkmark-1.png" if len(item) == 0 else "trashcan.png"))
             btn.setFixedWidth(30)
             btn.setStyleSheet(
                 "background-color: #FFFFFF; border: 1px solid gray; border-radius: 2px; cursor: pointer")
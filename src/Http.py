@@ -0,0 +1,412 @@
+import contextlib
+import contextvars
+import email.utils
+import os
+import random
+import tempfile
+import threading
+import time
+import urllib.parse
+from typing import Dict, Iterable, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .Config import Config
+from .Exceptions import DownloadCancelledException
+from .Trace import span
+
+"""(connect, read) timeouts in seconds used for every request unless a caller asks for something else"""
+default_timeout = (5.0, 15.0)
+
+"""Downloads are streamed in chunks of this size, and aborted once they get bigger than the maximum"""
+download_chunk_size = 64 * 1024
+max_download_size = 20 * 1024 * 1024
+
+"""(requests per second, burst) each host may get, unless the 'hostRates' option says otherwise. Hosts that aren't
+listed get `default_rate`."""
+host_rates: Dict[str, Tuple[float, int]] = {
+    "korean.dict.naver.com": (2.0, 2),
+    "krdict.korean.go.kr": (2.0, 2),
+    "shtooka.net": (2.0, 2),
+    "assets.languagepod101.com": (4.0, 4),
+    "www.japanesepod101.com": (2.0, 2),
+}
+default_rate = (8.0, 8)
+
+"""Retries of requests that timed out or got a 429/5xx response, with exponential backoff and jitter"""
+max_retries = 3
+backoff_base = 0.5  # seconds before the first retry
+backoff_max = 30.0  # also the longest a request waits for its host's rate limit
+retry_statuses = {429, 500, 502, 503, 504}
+
+desktop_user_agent = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/86.0.4240.198 Safari/537.36'
+legacy_user_agent = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_9_3) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/35.0.1916.47 Safari/537.36'
+
+"""Headers each source sends. They are passed per request, so sources can't overwrite each other's headers anymore."""
+header_profiles = {
+    "default": {
+        'User-Agent': desktop_user_agent,
+    },
+    "naver": {
+        'Accept': '*/*',
+        'DNT': '1',
+        'Cookie': 'nid_slevel=1; nid_enctp=1; nx_ssl=2',
+        'Accept-Language': 'en,ko-KR;q=0.9,ko;q=0.8,en-US;q=0.7',
+        'User-Agent': desktop_user_agent,
+        'Sec-Fetch-Mode': 'no-cors',
+        'Sec-Fetch-Site': 'same-site',
+        'Cache-Control': 'no-cache',
+        'upgrade-insecure-requests': '1',
+    },
+    "krdict": {
+        'User-Agent': desktop_user_agent,
+    },
+    "shtooka": {
+        'User-Agent': legacy_user_agent,
+    },
+    "jp101": {
+        'User-Agent': legacy_user_agent,
+    },
+    "jp101alt": {
+        'User-Agent': desktop_user_agent,
+    },
+}
+
+
+class DownloadError(IOError):
+    """A download was aborted because it was too big or ended before all of its bytes arrived."""
+
+
+class RateLimitTimeout(requests.Timeout):
+    """The rate limit of a host would have kept a request waiting for longer than allowed."""
+
+
+_cancel_event: contextvars.ContextVar = contextvars.ContextVar("audio_dl_cancel", default=None)
+
+
+@contextlib.contextmanager
+def cancel_on(event: threading.Event):
+    """Requests made within `with cancel_on(event):` stop waiting for rate limits and backoff as soon as `event`
+    is set, and raise DownloadCancelledException. Also applies to lookups run on other threads in a copy of the
+    context (see Lookup.py)."""
+    token = _cancel_event.set(event)
+    try:
+        yield
+    finally:
+        _cancel_event.reset(token)
+
+
+def cancel_requested() -> bool:
+    """Whether the cancel_on() event of the current context is set."""
+    event = _cancel_event.get()
+    return event is not None and event.is_set()
+
+
+def check_cancelled(chunks: Iterable[bytes]) -> Iterable[bytes]:
+    for chunk in chunks:
+        if cancel_requested():
+            raise DownloadCancelledException()
+        yield chunk
+
+
+def wait(delay: float, cancelled: Union[threading.Event, None]):
+    """Sleeps for `delay` seconds, unless `cancelled` gets set before."""
+    if cancelled is None:
+        time.sleep(delay)
+    elif cancelled.wait(delay):
+        raise DownloadCancelledException()
+
+
+class TokenBucket:
+    """Hands out up to `rate` requests per second, with bursts of up to `burst`. The rate gets halved whenever the
+    host pushes back and slowly grows back to the configured rate after successful requests, so bulk runs settle
+    at the highest rate a site tolerates."""
+
+    def __init__(self, rate: float, burst: int):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0  # set from Retry-After
+        self._lock = threading.Lock()
+
+    def acquire(self, max_wait: float = None, cancelled: threading.Event = None) -> float:
+        """Blocks until a request may be sent. Returns the seconds spent waiting. Raises RateLimitTimeout instead of
+        waiting for longer than `max_wait`, and DownloadCancelledException once `cancelled` is set."""
+        waited = 0.0
+        while True:
+            if cancelled is not None and cancelled.is_set():
+                raise DownloadCancelledException()
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now >= self.blocked_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = max(self.blocked_until - now, (1 - self.tokens) / self.rate)
+            if max_wait is not None and waited + delay > max_wait:
+                raise RateLimitTimeout("Would have to wait %.1fs for the rate limit" % (waited + delay))
+            wait(delay, cancelled)
+            waited += delay
+
+    def slow_down(self, retry_after: float = None):
+        """Halves the rate. Retry-After blocks the host, for backoff_max at most."""
+        with self._lock:
+            self.rate = max(self.max_rate / 16, self.rate / 2)
+            self.tokens = min(self.tokens, 0.0)
+            if retry_after is not None:
+                self.blocked_until = max(self.blocked_until, time.monotonic() + min(retry_after, backoff_max))
+
+    def speed_up(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 10)
+
+
+class RateLimiter:
+    """One token bucket per host. Keeps track of how long requests to each host had to wait, both for tokens and
+    for backoff between retries."""
+
+    def __init__(self, rates: Dict[str, Tuple[float, int]] = None, fallback_rate: Tuple[float, int] = default_rate):
+        self.rates = rates if rates is not None else host_rates
+        self.fallback_rate = fallback_rate
+        self.throttled: Dict[str, float] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def set_rates(self, rates: Dict[str, Tuple[float, int]]):
+        """Switches to other per-host rates. Hosts whose rate changed start over with a new bucket."""
+        with self._lock:
+            for host in set(self.rates) | set(rates):
+                if self.rates.get(host) != rates.get(host):
+                    self._buckets.pop(host, None)
+            self.rates = rates
+
+    def bucket(self, host: str) -> TokenBucket:
+        with self._lock:
+            if host not in self._buckets:
+                self._buckets[host] = TokenBucket(*self.rates.get(host, self.fallback_rate))
+            return self._buckets[host]
+
+    def add_throttled(self, host: str, seconds: float):
+        if seconds > 0:
+            with self._lock:
+                self.throttled[host] = self.throttled.get(host, 0.0) + seconds
+
+    def acquire(self, host: str, max_wait: float = None, cancelled: threading.Event = None):
+        self.add_throttled(host, self.bucket(host).acquire(max_wait, cancelled))
+
+    def report(self) -> Dict[str, float]:
+        """Seconds each host spent throttled since the last reset."""
+        with self._lock:
+            return dict(self.throttled)
+
+    def reset_report(self):
+        with self._lock:
+            self.throttled.clear()
+
+
+def parse_retry_after(value: Union[str, None]) -> Union[float, None]:
+    """Retry-After is either a number of seconds or an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, min(backoff_max, backoff_base * 2 ** attempt))
+
+
+class ResponseBuffer:
+    """In-memory store for bodies that were fetched ahead of time (see Prefetch.py). URLs that are still being
+    fetched are tracked, so a download that asks for one waits for the prefetch instead of starting a second fetch."""
+
+    def __init__(self):
+        self._data: Dict[str, bytes] = {}
+        self._pending: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+
+    def begin(self, url: str):
+        with self._lock:
+            self._pending.setdefault(url, threading.Event())
+
+    def put(self, url: str, data: bytes):
+        with self._lock:
+            self._data[url] = data
+            event = self._pending.pop(url, None)
+        if event is not None:
+            event.set()
+
+    def abort(self, url: str):
+        with self._lock:
+            event = self._pending.pop(url, None)
+        if event is not None:
+            event.set()
+
+    def pop(self, url: str, timeout: float = None) -> Union[bytes, None]:
+        """Returns and removes the buffered body of `url`, waiting up to `timeout` if it is still being fetched."""
+        with self._lock:
+            event = self._pending.get(url)
+        if event is not None:
+            event.wait(timeout)
+        with self._lock:
+            return self._data.pop(url, None)
+
+    def size(self) -> int:
+        with self._lock:
+            return sum(len(data) for data in self._data.values())
+
+    def discard(self, urls: Iterable[str]):
+        with self._lock:
+            for url in urls:
+                self._data.pop(url, None)
+
+
+class Transport:
+    """Shared HTTP layer for all sources. Connections are pooled per host and kept alive between requests, so a
+    search followed by its audio downloads only pays for one TCP/TLS handshake per host."""
+
+    def __init__(self, pool_connections: int = 10, pool_maxsize: int = 8, timeout=default_timeout,
+                 max_download_size: int = max_download_size, limiter: RateLimiter = None, retries: int = max_retries):
+        self.timeout = timeout
+        self.max_download_size = max_download_size
+        self.limiter = limiter or RateLimiter()
+        self.retries = retries
+        self.buffer = ResponseBuffer()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, method: str, url: str, profile: str = "default", headers: dict = None, **kwargs) -> requests.Response:
+        """Sends a request with the headers of `profile`, within the rate limit of the host. Timeouts and 429/5xx
+        responses are retried up to `retries` times. Raises requests.HTTPError for 4xx/5xx responses, RateLimitTimeout if
+        the host's rate limit would hold the request back for more than backoff_max seconds, and
+        DownloadCancelledException if the request was made within cancel_on() and got cancelled while waiting."""
+        merged_headers = dict(header_profiles[profile])
+        if headers is not None:
+            merged_headers.update(headers)
+        kwargs.setdefault("timeout", self.timeout)
+        host = urllib.parse.urlsplit(url).hostname or ""
+        bucket = self.limiter.bucket(host)
+        cancelled = _cancel_event.get()
+        attempt = 0
+        while True:
+            self.limiter.acquire(host, backoff_max, cancelled)
+            try:
+                with span("http", method=method, host=host, attempt=attempt):
+                    res = self.session.request(method, url, headers=merged_headers, **kwargs)
+            except (requests.Timeout, requests.ConnectionError):
+                if attempt >= self.retries:
+                    raise
+                bucket.slow_down()
+                delay = backoff_delay(attempt)
+            else:
+                if res.status_code not in retry_statuses or attempt >= self.retries:
+                    if res.status_code < 400:
+                        bucket.speed_up()
+                    res.raise_for_status()
+                    return res
+                retry_after = parse_retry_after(res.headers.get("Retry-After"))
+                bucket.slow_down(retry_after)
+                if retry_after is not None and retry_after > backoff_max:
+                    res.raise_for_status()  # not worth waiting for
+                delay = retry_after if retry_after is not None else backoff_delay(attempt)
+                res.close()
+            self.limiter.add_throttled(host, delay)
+            wait(delay, cancelled)
+            attempt += 1
+
+    def get(self, url: str, profile: str = "default", **kwargs) -> requests.Response:
+        return self.request("GET", url, profile, **kwargs)
+
+    def post(self, url: str, profile: str = "default", **kwargs) -> requests.Response:
+        return self.request("POST", url, profile, **kwargs)
+
+    def download(self, url: str, path: str, profile: str = "default", max_size: int = None):
+        """Writes the body of `url` to `path`. Bodies that were prefetched into the buffer are used without a request.
+
+        The body is streamed in fixed-size chunks into a unique temp file next to `path`, which only replaces `path`
+        once the download is complete, so a failed transfer never leaves a truncated file behind and downloads of
+        the same file can't mix their bytes. Raises DownloadError if the body is bigger than `max_size` or shorter
+        than its Content-Length."""
+        max_size = max_size or self.max_download_size
+        data = self.buffer.pop(url, timeout=self.timeout[1])
+        if data is not None:
+            if len(data) > max_size:
+                raise DownloadError("%s is bigger than %d bytes" % (url, max_size))
+            self._write_atomic(path, [data])
+            return
+
+        with self.get(url, profile, stream=True) as res:
+            length = res.headers.get("Content-Length")
+            expected = int(length) if length is not None and "Content-Encoding" not in res.headers else None
+            if expected is not None and expected > max_size:
+                raise DownloadError("%s is bigger than %d bytes" % (url, max_size))
+            self._write_atomic(path, check_cancelled(res.iter_content(download_chunk_size)), max_size, expected)
+
+    @staticmethod
+    def _write_atomic(path: str, chunks: Iterable[bytes], max_size: int = None, expected: int = None) -> int:
+        """Writes the chunks to a temp file in the folder of `path` and renames it to `path` if all went well."""
+        fd, temp_path = tempfile.mkstemp(prefix=".download-", suffix=".part", dir=os.path.dirname(path) or None)
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    size += len(chunk)
+                    if max_size is not None and size > max_size:
+                        raise DownloadError("%s is bigger than %d bytes" % (path, max_size))
+                    f.write(chunk)
+            if expected is not None and size != expected:
+                raise DownloadError("Only got %d of %d bytes for %s" % (size, expected, path))
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        return size
+
+    def close(self):
+        self.session.close()
+
+
+def get_host_rates(config: Config) -> Dict[str, Tuple[float, int]]:
+    """The 'hostRates' option, whose entries look like "shtooka.net 2 2" (host, requests per second, burst).
+    Entries that can't be read are skipped."""
+    rates = {}
+    for entry in config.get_config_object("hostRates").value:
+        try:
+            host, rate, burst = entry.split()
+            rates[host] = (float(rate), int(burst))
+        except ValueError:
+            continue
+    return rates
+
+
+_transport: Union[Transport, None] = None
+_transport_lock = threading.Lock()
+
+
+def get_transport() -> Transport:
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            from .. import config
+            _transport = Transport(limiter=RateLimiter(get_host_rates(config)))
+        return _transport
+
+
+def apply_host_rates(config: Config):
+    """Hands changes of the 'hostRates' option to the transport, if there is one already."""
+    with _transport_lock:
+        if _transport is not None:
+            _transport.limiter.set_rates(get_host_rates(config))
@@ -1,101 +1,103 @@
-import base64
+import hashlib
 import os
-import re
-import requests
-import urllib.request
+import tempfile
 import urllib.parse
-from dataclasses import dataclass
-from http.client import HTTPResponse
-from typing import List, Union
-from urllib.error import HTTPError
+from typing import List, Set, Union
 
-from aqt import AnkiQt
-from bs4 import BeautifulSoup, Tag
+from requests import HTTPError
 from .Config import Config
 from .Exceptions import NoResultsException
-from .Util import log_debug
+from .Http import get_transport
+from .Pronunciation import Pronunciation
+from .Util import log_debug, prepare_query_string
 
 search_url = "https://assets.languagepod101.com/dictionary/japanese/audiomp3.php"
 
-
-@dataclass
-class Pronunciation:
-	language: str
-	user: str
-	origin: str
-	id: int
-	votes: str
-	download_url: bytes
-	is_ogg: bool
-	word: str
-	mw: AnkiQt
-	audio: Union[str, None] = None
-	
-	def download_pronunciation(self):
-		from .. import temp_dir
-		#dl_path = os.path.join(temp_dir, "pronunciation_" + self.language + "_" + self.word + (".ogg" if self.is_ogg else ".mp3"))
-		dl_path = os.path.join(temp_dir, 'jp101-' + self.word + '.mp3')
-		with open(dl_path, "wb") as f:
-			f.write(self.download_url)
-		
-		media_name = self.mw.col.media.add_file(dl_path)
-		self.audio = media_name
-	
-	def remove_pronunciation(self):
-		self.mw.col.media.trash_files([self.audio])
-		self.audio = None
-
-
-def prepare_query_string(input: str, config: Config) -> str:
-	query = str(input)
-	query = query.strip()
-	for char in config.get_config_object("replaceCharacters").value:
-		query = query.replace(char, "")
-	log_debug("[JapanesePod101.py] Using search query: %s" % query)
-	return query
+"""Size of the "audio not available" MP3 that is returned for words without a recording"""
+placeholder_size = 52288
+"""Bytes at the start of a response that get compared against placeholders seen before"""
+fingerprint_size = 4096
+placeholder_fingerprints: Set[str] = set()
+chunk_size = 16 * 1024
 
 
 class JapanesePod101:
 	def __init__(self, word: str, language: str, mw, config: Config, kana: str):
-		self.html: bytes
+		self.url: str
+		self.audio_path: Union[str, None] = None  # the spooled audio, None if the site had no recording
 		self.language = language
 		self.word = prepare_query_string(word, config)
 		self.pronunciations: List[Pronunciation] = []
 		self.mw = mw
 		self.kana = kana
-		
-		opener = urllib.request.build_opener()
-		opener.addheaders = [('User-Agent', 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_9_3) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/35.0.1916.47 Safari/537.36')]
-		urllib.request.install_opener(opener)
 	
 	def load_search_query(self):
 		try:
 			log_debug("[JapanesePod101.py] Reading result page")
-			url = search_url + '?kanji=' + urllib.parse.quote_plus(self.word) + '&kana=' + urllib.parse.quote_plus(self.kana)
-			self.html = urllib.request.urlopen(url).read()
+			self.url = search_url + '?kanji=' + urllib.parse.quote_plus(self.word) + '&kana=' + urllib.parse.quote_plus(self.kana)
+			with get_transport().get(self.url, "jp101", stream=True) as res:
+				self.audio_path = self.spool(res)
 			log_debug("[JapanesePod101.py] Done with reading result page")
 			
 			return self
 		except Exception as e:
-			log_debug("[JapanesePod101.py] Exception: " + str(e))
+			log_debug("[JapanesePod101.py] Exception: %s", e)
 			if isinstance(e, HTTPError):
 				e: HTTPError
-				if e.code == 404:
+				if e.response.status_code == 404:
 					raise NoResultsException()
 			else:
 				raise e
 	
+	def spool(self, res) -> Union[str, None]:
+		"""The search response already is the MP3, so it gets written straight into temp_dir. Returns None without
+		reading the rest of the body as soon as the response turns out to be the placeholder."""
+		from .. import temp_dir
+		length = res.headers.get("Content-Length")
+		if length is not None and int(length) == placeholder_size and "Content-Encoding" not in res.headers:
+			log_debug("[JapanesePod101.py] Placeholder detected from Content-Length")
+			return None
+		
+		fd, path = tempfile.mkstemp(prefix="jp101-", suffix=".part", dir=temp_dir)
+		prefix = b""
+		size = 0
+		is_placeholder = False
+		try:
+			with os.fdopen(fd, "wb") as f:
+				for chunk in res.iter_content(chunk_size):
+					if len(prefix) < fingerprint_size:
+						prefix += chunk[:fingerprint_size - len(prefix)]
+						if len(prefix) == fingerprint_size and hashlib.sha1(prefix).hexdigest() in placeholder_fingerprints:
+							log_debug("[JapanesePod101.py] Placeholder detected from its first bytes")
+							is_placeholder = True
+							break
+					f.write(chunk)
+					size += len(chunk)
+		except BaseException:
+			os.remove(path)
+			raise
+		
+		if size == placeholder_size:
+			# Remember how the placeholder starts, so the next one can be dropped after a few KB
+			placeholder_fingerprints.add(hashlib.sha1(prefix).hexdigest())
+			is_placeholder = True
+		if is_placeholder:
+			os.remove(path)
+			return None
+		return path
+	
 	def get_pronunciations(self):
 		log_debug("[JapanesePod101.py] Going through all pronunciations")
 		
-		if len(self.html) != 52288:
+		if self.audio_path is not None:
 			subtitle = self.kana
 			origin = ""
 			id = 1
 			vote_count = ""
-			dl_url = self.html
+			dl_url = self.url
 			is_ogg = True
-			self.pronunciations.append(Pronunciation(self.language, subtitle, origin, id, vote_count, dl_url, is_ogg, self.word, self.mw))
+			self.pronunciations.append(Pronunciation(self.language, subtitle, origin, id, vote_count, dl_url, is_ogg, self.word, self.mw, profile="jp101",
+													 file_name='jp101-' + self.word + '.mp3', local_path=self.audio_path))
 		return self
 	
 	def download_pronunciations(self):
@@ -103,9 +105,3 @@ class JapanesePod101:
 			pronunciation.download_pronunciation()
 		
 		return self
-	
-	@staticmethod
-	def cleanup():
-		from .. import temp_dir
-		for f in os.listdir(temp_dir):
-			os.remove(os.path.join(temp_dir, f))
@@ -1,14 +1,12 @@
-import json
-import os
-
 from PyQt5.QtCore import Qt
 from PyQt5.QtWidgets import QDialog, QVBoxLayout, QLabel, QComboBox, QPushButton
 
+from .Assets import get_assets
+
 
 class LanguageSelector(QDialog):
 
     def __init__(self, parent, deck_name):
-        from .. import asset_dir
         super().__init__(parent)
         self.setWindowTitle("Select Language")
         self.setFixedWidth(400)
@@ -30,8 +28,8 @@ class LanguageSelector(QDialog):
         self.next_btn.clicked.connect(lambda: self.close())
 
         self.language_select = QComboBox()
-        with open(os.path.join(asset_dir, "languages.json"), encoding="utf8") as f:
-            self.language_list = json.loads(f.read())
+        self.languages = get_assets().languages
+        self.language_list = self.languages.records
 
         [self.language_select.addItem(lang["English name"], lang["Code"]) for lang in self.language_list]
         self.language_select.setEditable(True)
@@ -52,12 +50,12 @@ class LanguageSelector(QDialog):
             self.selected_lang = self.language_select.itemData(index)
 
     def on_text_change(self, new_text: str):
-        res = next((item for item in self.language_list if item["English name"] == new_text), None)
+        code = self.languages.code_by_name.get(new_text)
 
-        if res is not None:
+        if code is not None:
             self.next_btn.setEnabled(True)
             self.next_btn.setVisible(True)
-            self.selected_lang = res["Code"]
+            self.selected_lang = code
         else:
             self.next_btn.setEnabled(False)
             self.next_btn.setVisible(False)
@@ -0,0 +1,210 @@
+import os
+import re
+import sqlite3
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Tuple, Union
+
+from .Util import log_debug
+
+try:
+    import mutagen
+except ImportError:
+    mutagen = None
+
+audio_extensions = (".mp3", ".ogg", ".oga", ".opus", ".flac", ".wav", ".m4a", ".spx")
+
+"""Shtooka packs describe their files in this file, one [filename] section with SWAC_* tags per recording"""
+tags_file_name = "index.tags.txt"
+
+"""ISO 639-3 codes used by Shtooka packs, mapped to the codes the decks are configured with"""
+language_codes = {
+    "ara": "ar", "bel": "be", "ces": "cs", "cze": "cs", "cmn": "zh", "zho": "zh", "chi": "zh", "deu": "de", "ger": "de",
+    "eng": "en", "ita": "it", "fra": "fr", "fre": "fr", "nld": "nl", "dut": "nl", "pol": "pl", "por": "pt", "rus": "ru",
+    "spa": "es", "swe": "sv", "srp": "sr", "ukr": "uk", "wol": "wo", "jpn": "ja", "kor": "ko",
+}
+
+
+@dataclass
+class LibraryEntry:
+    word: str
+    language: str  # empty if the file didn't say, which matches every language
+    path: str
+    speaker: str
+
+
+def normalize(word: str) -> str:
+    return " ".join(word.split()).casefold()
+
+
+def normalize_language(code: Union[str, None]) -> str:
+    if not code:
+        return ""
+    code = code.strip().lower()
+    return language_codes.get(code, code)
+
+
+def read_tags_file(path: str) -> Dict[str, Dict[str, str]]:
+    """Parses an index.tags.txt into {file name: {tag: value}}."""
+    sections: Dict[str, Dict[str, str]] = {}
+    current = None
+    with open(path, encoding="utf8", errors="replace") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("[") and line.endswith("]"):
+                current = sections.setdefault(line[1:-1], {})
+            elif current is not None and "=" in line:
+                key, value = line.split("=", 1)
+                current[key.strip().upper()] = value.strip()
+    return sections
+
+
+def read_embedded_tags(path: str) -> Dict[str, str]:
+    """Tags stored in the audio file itself. Only available if mutagen is installed."""
+    if mutagen is None:
+        return {}
+    try:
+        audio = mutagen.File(path, easy=True)
+    except Exception as e:
+        log_debug("[LibraryIndex.py] Couldn't read tags of %s: %s", path, e)
+        return {}
+    if audio is None or audio.tags is None:
+        return {}
+    tags = {}
+    for key in ["swac_text", "title", "swac_lang", "language", "swac_speak_name", "artist"]:
+        try:
+            value = audio.tags.get(key)
+        except (KeyError, ValueError):
+            continue
+        if value:
+            tags[key.upper()] = value[0] if isinstance(value, list) else str(value)
+    return tags
+
+
+def word_from_file_name(file_name: str) -> str:
+    """'Hund.mp3', 'Hund_2.mp3' and 'Hund (2).mp3' all are recordings of 'Hund'."""
+    stem = os.path.splitext(file_name)[0]
+    stem = re.sub(r'(\s*\(\d+\)|_\d+)$', '', stem)
+    return stem.replace("_", " ")
+
+
+class LibraryIndex:
+    """Full-text index of a folder of audio files, e.g. unpacked Shtooka collections or recordings of your own.
+    Words, languages and speakers come from index.tags.txt files, the files' own tags, or else from the file and
+    folder names. refresh() only reads files that are new or changed since the last run."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.fts = True
+        self._conn: Union[sqlite3.Connection, None] = None
+        self._lock = threading.Lock()
+        self._refreshing = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            try:
+                self._conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS entries USING fts5("
+                                   "word, language UNINDEXED, path UNINDEXED, speaker UNINDEXED)")
+            except sqlite3.OperationalError:
+                # SQLite without FTS5, an ordinary index on the word does the job as well
+                self.fts = False
+                self._conn.execute("CREATE TABLE IF NOT EXISTS entries (word TEXT, language TEXT, path TEXT, speaker TEXT)")
+                self._conn.execute("CREATE INDEX IF NOT EXISTS entries_word ON entries (word)")
+            # entries share their rowid with the file they came from, so they can be replaced without a scan
+            self._conn.execute("CREATE TABLE IF NOT EXISTS files (id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL, mtime REAL NOT NULL)")
+            self._conn.commit()
+        return self._conn
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._connect().execute("SELECT 1 FROM files LIMIT 1").fetchone() is None
+
+    def lookup(self, word: str, language: str) -> List[LibraryEntry]:
+        """All recordings of exactly this word in this language (or without a language)."""
+        word = normalize(word)
+        if not word:
+            return []
+        with self._lock:
+            conn = self._connect()
+            if self.fts:
+                rows = conn.execute("SELECT word, language, path, speaker FROM entries WHERE entries MATCH ?",
+                                    ('word: "%s"' % word.replace('"', '""'),)).fetchall()
+            else:
+                rows = conn.execute("SELECT word, language, path, speaker FROM entries WHERE word = ?", (word,)).fetchall()
+        # the phrase query also finds longer entries containing the word
+        return [LibraryEntry(*row) for row in rows if row[0] == word and row[1] in (language, "")]
+
+    def refresh(self, root: str) -> Tuple[int, int]:
+        """Brings the index up to date with the files below `root`. Returns (indexed, removed) file counts."""
+        if not self._refreshing.acquire(blocking=False):
+            return 0, 0  # a refresh is already running
+        try:
+            with self._lock:
+                known = {path: (file_id, mtime) for file_id, path, mtime in self._connect().execute("SELECT id, path, mtime FROM files")}
+            seen = set()
+            indexed = 0
+            for directory, _, files in os.walk(root):
+                audio_files = [f for f in files if f.lower().endswith(audio_extensions)]
+                if not audio_files:
+                    continue
+                tags_path = os.path.join(directory, tags_file_name)
+                tags_mtime = os.path.getmtime(tags_path) if tags_file_name in files else 0
+                tags = None
+                folder_language = self._folder_language(root, directory)
+                rows = []
+                changed = []
+                for file_name in audio_files:
+                    path = os.path.join(directory, file_name)
+                    seen.add(path)
+                    mtime = max(os.path.getmtime(path), tags_mtime)
+                    if path in known and known[path][1] == mtime:
+                        continue
+                    if tags is None:
+                        tags = read_tags_file(tags_path) if tags_mtime else {}
+                    file_tags = tags.get(file_name) or read_embedded_tags(path)
+                    word = file_tags.get("SWAC_TEXT") or file_tags.get("TITLE") or word_from_file_name(file_name)
+                    language = normalize_language(file_tags.get("SWAC_LANG") or file_tags.get("LANGUAGE")) or folder_language
+                    speaker = file_tags.get("SWAC_SPEAK_NAME") or file_tags.get("ARTIST") or ""
+                    rows.append((normalize(word), language, path, speaker))
+                    changed.append((path, mtime))
+                if changed:
+                    with self._lock:
+                        conn = self._connect()
+                        for (path, mtime), row in zip(changed, rows):
+                            if path in known:
+                                file_id = known[path][0]
+                                conn.execute("DELETE FROM entries WHERE rowid = ?", (file_id,))
+                                conn.execute("UPDATE files SET mtime = ? WHERE id = ?", (mtime, file_id))
+                            else:
+                                file_id = conn.execute("INSERT INTO files (path, mtime) VALUES (?, ?)", (path, mtime)).lastrowid
+                            conn.execute("INSERT INTO entries (rowid, word, language, path, speaker) VALUES (?, ?, ?, ?, ?)", (file_id,) + row)
+                        conn.commit()
+                    indexed += len(changed)
+            removed = [known[path][0] for path in known if path not in seen]
+            if removed:
+                with self._lock:
+                    conn = self._connect()
+                    conn.executemany("DELETE FROM entries WHERE rowid = ?", [(file_id,) for file_id in removed])
+                    conn.executemany("DELETE FROM files WHERE id = ?", [(file_id,) for file_id in removed])
+                    conn.commit()
+            log_debug("[LibraryIndex.py] Indexed %d files and removed %d below %s", indexed, len(removed), root)
+            return indexed, len(removed)
+        finally:
+            self._refreshing.release()
+
+    @staticmethod
+    def _folder_language(root: str, directory: str) -> str:
+        """Custom folders can be sorted into one folder per language, e.g. library/de/Hund.mp3"""
+        for part in os.path.relpath(directory, root).split(os.sep):
+            code = normalize_language(part)
+            if part != "." and (len(code) == 2 or part.lower() in language_codes):
+                return code
+        return ""
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
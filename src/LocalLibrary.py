@@ -0,0 +1,94 @@
+import os
+import shutil
+import threading
+from typing import List
+
+from .Config import Config
+from .Exceptions import NoResultsException
+from .LibraryIndex import LibraryIndex
+from .Pronunciation import Pronunciation
+from .Trace import span
+from .Util import log_debug, prepare_query_string
+
+_refresh_started = threading.Event()
+
+
+def get_library_folder(config: Config) -> str:
+	"""The folder set in the options, user_files/library by default."""
+	from .. import user_files_dir
+	return config.get_config_object("localLibraryFolder").value or os.path.join(user_files_dir, "library")
+
+
+def refresh_index(index: LibraryIndex, folder: str):
+	"""Updates the index in the background once per session, so new files are found without slowing down lookups.
+	Until an index that was never built is ready, the library has no results and the sites are asked instead."""
+	if _refresh_started.is_set():
+		return
+	_refresh_started.set()
+	if index.is_empty():
+		log_debug("[LocalLibrary.py] Building the index of %s in the background", folder)
+	threading.Thread(target=index.refresh, args=(folder,), name="audio-dl-library", daemon=True).start()
+
+
+def library_exists(config: Config) -> bool:
+	return os.path.isdir(get_library_folder(config))
+
+
+class LocalPronunciation(Pronunciation):
+	"""download_url is the path of the file in the library, which gets copied instead of moved."""
+	
+	def download_pronunciation(self):
+		from .. import temp_dir
+		dl_path = self.make_download_path(temp_dir)
+		with span("download", file=self.get_file_name()):
+			try:
+				shutil.copyfile(self.download_url, dl_path)
+			except BaseException:
+				shutil.rmtree(os.path.dirname(dl_path), ignore_errors=True)
+				raise
+		self.add_to_collection(dl_path)
+
+
+class LocalLibrary:
+	"""Recordings from a folder on this computer, e.g. downloaded Shtooka collections. Answers without any network
+	access, which is why it gets asked before the sites (see Sources.py)."""
+	pronunciation_class = LocalPronunciation
+	
+	def __init__(self, word: str, language: str, mw, config: Config):
+		self.language = language
+		self.word = prepare_query_string(word, config)
+		self.folder = get_library_folder(config)
+		self.pronunciations: List[Pronunciation] = []
+		self.entries = []
+		self.mw = mw
+	
+	def load_search_query(self):
+		from .. import library_index
+		if not os.path.isdir(self.folder):
+			raise NoResultsException()
+		refresh_index(library_index, self.folder)
+		self.entries = library_index.lookup(self.word, self.language)
+		log_debug("[LocalLibrary.py] Found %d recordings of %s", len(self.entries), self.word)
+		return self
+	
+	def get_pronunciations(self):
+		for i, entry in enumerate(self.entries):
+			if not os.path.isfile(entry.path):
+				continue  # removed since the last refresh
+			subtitle = entry.speaker or os.path.basename(os.path.dirname(entry.path))
+			origin = "Local library"
+			id = i + 1
+			vote_count = ""
+			dl_url = entry.path
+			is_ogg = not entry.path.lower().endswith(".mp3")
+			file_name = "library-" + os.path.basename(entry.path)
+			self.pronunciations.append(LocalPronunciation(self.language, subtitle, origin, id, vote_count, dl_url, is_ogg, self.word, self.mw, file_name=file_name))
+		if not self.pronunciations:
+			raise NoResultsException()
+		return self
+	
+	def download_pronunciations(self):
+		for pronunciation in self.pronunciations:
+			pronunciation.download_pronunciation()
+	
+		return self
@@ -0,0 +1,272 @@
+import concurrent.futures
+import contextvars
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Union
+
+from aqt import AnkiQt
+from anki.notes import Note
+
+from .Config import Config
+from .Dedup import Deduplicator
+from .Exceptions import KnownMissException, NoResultsException, LookupTimeoutException
+from .Pronunciation import Pronunciation, discard_unused
+from .Sources import SourceInfo, get_sources
+from .Trace import span
+from .Util import log_debug
+
+default_timeout = 20.0  # seconds a single source may take once it started running before its results are dropped
+max_workers = 8
+tasks_per_lookup = 3  # most tasks a lookup runs at the same time, used to size the pool for bulk runs
+queue_poll_interval = 0.05  # how often the engine checks whether queued tasks started running
+
+_executor: Union[concurrent.futures.ThreadPoolExecutor, None] = None
+_executor_size = 0
+_executor_lock = threading.Lock()
+
+
+def get_executor(min_workers: int = max_workers) -> concurrent.futures.ThreadPoolExecutor:
+	"""Returns the process-wide pool that source lookups run on. Threads are reused across lookups so that a
+	source that blows its deadline doesn't block the next lookup from starting. The pool gets replaced by a bigger
+	one if a caller needs more than `min_workers` threads, e.g. bulk runs that do several lookups at once."""
+	global _executor, _executor_size
+	with _executor_lock:
+		if _executor is None or _executor_size < min_workers:
+			old = _executor
+			_executor_size = max(max_workers, min_workers)
+			_executor = concurrent.futures.ThreadPoolExecutor(max_workers=_executor_size, thread_name_prefix="audio-dl-lookup")
+			if old is not None:
+				old.shutdown(wait=False)  # lookups that are still running on it finish there
+		return _executor
+
+
+@dataclass
+class LookupTask:
+	"""A single source query. `load` runs on a worker thread and returns the source's pronunciation list."""
+	name: str
+	load: Callable[[], list]
+	timeout: float = default_timeout
+	preferred: bool = False  # runs before the other tasks, which are skipped if it found something
+	cached: bool = True  # whether the task uses the search cache and can report known misses
+
+
+@dataclass
+class LookupResult:
+	pronunciations: list = field(default_factory=list)
+	errors: Dict[str, Exception] = field(default_factory=dict)
+	timed_out: List[str] = field(default_factory=list)
+	known_misses: List[str] = field(default_factory=list)  # tasks that were skipped because of the negative cache
+
+
+class LookupEngine:
+	"""Fans out all source queries of a lookup at the same time and merges their results as they finish, so that
+	a lookup takes as long as its slowest source instead of the sum of all of them."""
+
+	def __init__(self, executor: concurrent.futures.Executor = None):
+		self.executor = executor or get_executor()
+
+	def run(self, tasks: List[LookupTask], on_result: Callable[[str, list, Union[Exception, None]], None] = None) -> LookupResult:
+		"""Runs all tasks concurrently. `on_result` gets called with (name, pronunciations, error) for every task as
+		soon as it finishes, fails or runs out of time. The merged pronunciations keep the order of `tasks`.
+		Preferred tasks run first; if they found anything, the other tasks are skipped and reported as empty."""
+		finished: Dict[str, list] = {}
+		result = LookupResult()
+		preferred = [task for task in tasks if task.preferred]
+		others = [task for task in tasks if not task.preferred]
+		if preferred:
+			self._run_batch(preferred, on_result, finished, result)
+			if any(finished.get(task.name) for task in preferred):
+				log_debug("[Lookup.py] Skipping %d sources, the preferred ones had results", len(others))
+				for task in others:
+					if on_result is not None:
+						on_result(task.name, [], None)
+				others = []
+		if others:
+			self._run_batch(others, on_result, finished, result)
+
+		dedup = Deduplicator()
+		for task in tasks:
+			result.pronunciations += dedup.add(finished.get(task.name, []))
+		return result
+
+	def _run_batch(self, tasks: List[LookupTask], on_result, finished: Dict[str, list], result: LookupResult):
+		"""A task's deadline starts once it runs, so time spent waiting for a free thread doesn't count."""
+		starts: Dict[int, float] = {}
+		
+		def run(task: LookupTask) -> list:
+			starts[id(task)] = time.monotonic()
+			return task.load()
+		
+		# the tasks run within the trace of the lookup, if there is one
+		futures = {self.executor.submit(contextvars.copy_context().run, run, task): task for task in tasks}
+		
+		def deadline(future) -> float:
+			task = futures[future]
+			start = starts.get(id(task))
+			return float("inf") if start is None else start + task.timeout
+		
+		pending = set(futures.keys())
+		while pending:
+			next_deadline = min(deadline(f) for f in pending)
+			if len(starts) < len(tasks):
+				next_deadline = min(next_deadline, time.monotonic() + queue_poll_interval)
+			wait_for = max(0.0, next_deadline - time.monotonic())
+			done, pending = concurrent.futures.wait(pending, timeout=wait_for, return_when=concurrent.futures.FIRST_COMPLETED)
+			for future in done:
+				task = futures[future]
+				try:
+					finished[task.name] = future.result() or []
+					error = None
+				except NoResultsException as e:
+					finished[task.name] = []
+					error = None
+					if isinstance(e, KnownMissException):
+						result.known_misses.append(task.name)
+				except Exception as e:
+					finished[task.name] = []
+					result.errors[task.name] = e
+					error = e
+				log_debug("[Lookup.py] %s finished after %.2fs with %d results", task.name, time.monotonic() - starts.get(id(task), time.monotonic()), len(finished[task.name]))
+				if on_result is not None:
+					on_result(task.name, finished[task.name], error)
+
+			now = time.monotonic()
+			for future in [f for f in pending if deadline(f) <= now]:
+				task = futures[future]
+				if not future.cancel():
+					future.add_done_callback(discard_late_results)  # still running, nobody will use what it finds
+				pending.discard(future)
+				result.timed_out.append(task.name)
+				log_debug("[Lookup.py] %s timed out after %.2fs", task.name, task.timeout)
+				if on_result is not None:
+					on_result(task.name, [], LookupTimeoutException(task.name))
+
+
+def discard_late_results(future: concurrent.futures.Future):
+	"""Removes the spooled audio of a task that finished after its deadline."""
+	if not future.cancelled() and future.exception() is None:
+		discard_unused(future.result() or [])
+
+
+def get_cache_query(source) -> str:
+	"""The normalized query a source's results get cached under. JapanesePod101 also searches by reading."""
+	kana = getattr(source, "kana", None)
+	return source.word if not kana else source.word + "\t" + kana
+
+
+def tag_source(pronunciations: List[Pronunciation], source_name: str) -> List[Pronunciation]:
+	for pronunciation in pronunciations:
+		if not pronunciation.sources:
+			pronunciation.sources.append(source_name)
+	return pronunciations
+
+
+def collect(source, use_cache: bool = True) -> list:
+	"""Runs a source's search and parse steps and returns its pronunciations (empty if the site had nothing).
+	Results are served from and stored in the search result cache. Queries the source recently had nothing for
+	raise KnownMissException without a request."""
+	from .. import search_cache
+	source_name = type(source).__name__
+	query = get_cache_query(source)
+	if use_cache:
+		if search_cache.is_known_miss(source_name, source.language, query):
+			raise KnownMissException(source_name)
+		records = search_cache.get(source_name, source.language, query)
+		if records is not None:
+			pronunciation_class = getattr(type(source), "pronunciation_class", Pronunciation)
+			return tag_source([pronunciation_class(**record, mw=source.mw) for record in records], source_name)
+
+	try:
+		loaded = source.load_search_query()
+		if loaded is not None:
+			with span("parse", source=source_name):
+				pronunciations = loaded.get_pronunciations().pronunciations
+		else:
+			pronunciations = None
+	except NoResultsException:
+		pronunciations = []
+	if pronunciations is None:
+		raise NoResultsException()  # the request failed, which says nothing about the word
+	tag_source(pronunciations, source_name)
+	if use_cache:
+		if pronunciations:
+			search_cache.put(source_name, source.language, query, pronunciations)
+		else:
+			search_cache.put_miss(source_name, source.language, query)
+	if not pronunciations:
+		raise NoResultsException()
+	return pronunciations
+
+
+def collect_first(*sources: Callable[[], object], use_cache: bool = True) -> list:
+	"""Queries the given source factories one after the other and returns the results of the first one that had any."""
+	known_misses = []
+	for make_source in sources:
+		try:
+			return collect(make_source(), use_cache)
+		except KnownMissException as e:
+			known_misses.append(e.specific_info)
+		except NoResultsException:
+			pass
+	if len(known_misses) == len(sources):
+		raise KnownMissException(", ".join(known_misses))
+	raise NoResultsException()
+
+
+def make_source(info: SourceInfo, query: str, language: str, mw: AnkiQt, config: Config, note: Note = None):
+	"""Imports the source if needed and creates it for a query."""
+	cls = info.load()
+	with span("query", source=info.name):
+		if info.reading_field is None:
+			return cls(query, language, mw, config)
+		reading = note[info.reading_field] if note is not None and info.reading_field in note.keys() else ""
+		return cls(query, language, mw, config, reading)
+
+
+def get_lookup_tasks(query: str, language: str, mw: AnkiQt, config: Config, note: Note = None) -> List[LookupTask]:
+	"""Determines which sources get queried for a language. Every primary source gets a task of its own; fallback
+	sources are only queried by the task of the first primary source, after it came back empty. Preferred sources
+	(the local library) get tasks that run before all others. Sources that aren't available, e.g. the local library
+	without a library folder, get no task."""
+	use_cache = config.get_config_object("cacheSearchResults").value
+	infos = [info for info in get_sources(language) if info.available is None or info.available(config)]
+	preferred = [info for info in infos if info.preferred]
+	primary = [info for info in infos if not info.fallback and not info.preferred]
+	fallbacks = [info for info in infos if info.fallback]
+
+	def factory(info: SourceInfo):
+		return lambda: make_source(info, query, language, mw, config, note)
+
+	tasks = []
+	for info in preferred:
+		load = lambda make=factory(info), cache=use_cache and info.cacheable: collect(make(), cache)
+		tasks.append(LookupTask(info.name, load, info.timeout or default_timeout, preferred=True, cached=use_cache and info.cacheable))
+	for i, info in enumerate(primary):
+		if i == 0 and fallbacks:
+			chain = [factory(info)] + [factory(fallback) for fallback in fallbacks]
+			load = lambda chain=chain: collect_first(*chain, use_cache=use_cache)
+			cached = use_cache
+		else:
+			load = lambda make=factory(info), cache=use_cache and info.cacheable: collect(make(), cache)
+			cached = use_cache and info.cacheable
+		tasks.append(LookupTask(info.name, load, info.timeout or default_timeout, cached=cached))
+	return tasks
+
+
+def lookup_pronunciations(query: str, language: str, mw: AnkiQt, config: Config, note: Note = None, on_result=None) -> list:
+	"""Queries all sources for a language at once and returns their merged pronunciations.
+	Raises NoResultsException if none of the sources had anything."""
+	tasks = get_lookup_tasks(query, language, mw, config, note)
+	result = LookupEngine().run(tasks, on_result=on_result)
+	if not result.pronunciations:
+		if result.errors:
+			raise next(iter(result.errors.values()))
+		if result.timed_out:
+			raise LookupTimeoutException(", ".join(result.timed_out))
+		# only tasks that use the cache can know a miss; preferred ones that came back empty say nothing either way
+		counted = [task.name for task in tasks if task.cached and not task.preferred]
+		if counted and all(name in result.known_misses for name in counted):
+			raise KnownMissException(", ".join(counted))
+		raise NoResultsException()
+	return result.pronunciations
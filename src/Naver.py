@@ -1,63 +1,17 @@
-import base64
 import json
-import os
-import re
-import urllib.request
 import urllib.parse
-from dataclasses import dataclass
-from http.client import HTTPResponse
-from typing import List, Union
-from urllib.error import HTTPError
+from typing import List
 
-from aqt import AnkiQt
-from bs4 import BeautifulSoup, Tag
+from requests import HTTPError
 from .Config import Config
 from .Exceptions import NoResultsException
-from .Util import log_debug
+from .Http import get_transport
+from .Pronunciation import Pronunciation
+from .Util import log_debug, prepare_query_string
 
 search_url = 'https://korean.dict.naver.com/api3/koen/search?m=mobile&shouldSearchVlive=true&lang=en&query='
 
 
-@dataclass
-class Pronunciation:
-	language: str
-	user: str
-	origin: str
-	id: int
-	votes: str
-	download_url: str
-	is_ogg: bool
-	word: str
-	mw: AnkiQt
-	audio: Union[str, None] = None
-	
-	def download_pronunciation(self):
-		from .. import temp_dir
-		req = urllib.request.Request(self.download_url)
-		#dl_path = os.path.join(temp_dir, "pronunciation_" + self.language + "_" + self.word + (".ogg" if self.is_ogg else ".mp3"))
-		dl_path = os.path.join(temp_dir, self.download_url.split("/")[len(self.download_url.split("/"))-1].split('?')[0])
-		with open(dl_path, "wb") as f:
-			res: HTTPResponse = urllib.request.urlopen(req)
-			f.write(res.read())
-			res.close()
-		
-		media_name = self.mw.col.media.add_file(dl_path)
-		self.audio = media_name
-	
-	def remove_pronunciation(self):
-		self.mw.col.media.trash_files([self.audio])
-		self.audio = None
-
-
-def prepare_query_string(input: str, config: Config) -> str:
-	query = str(input)
-	query = query.strip()
-	for char in config.get_config_object("replaceCharacters").value:
-		query = query.replace(char, "")
-	log_debug("[Naver.py] Using search query: %s" % query)
-	return query
-
-
 class Naver:
 	def __init__(self, word: str, language: str, mw, config: Config):
 		self.html = {}
@@ -65,34 +19,20 @@ class Naver:
 		self.word = prepare_query_string(word, config)
 		self.pronunciations: List[Pronunciation] = []
 		self.mw = mw
-		
-		opener = urllib.request.build_opener()
-		opener.addheaders = [
-			('Accept', '*/*'),
-			('DNT', 1),
-			('Host', 'ko.dict.naver.com'),
-			('Cookie', 'nid_slevel=1; nid_enctp=1; nx_ssl=2'),
-			('Accept-Language', 'en,ko-KR;q=0.9,ko;q=0.8,en-US;q=0.7'),
-			('User-Agent', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/86.0.4240.198 Safari/537.36'),
-			('Sec-Fetch-Mode', 'no-cors'),
-			('Sec-Fetch-Site', 'same-site'),
-			('Cache-Control', 'no-cache'),
-			('upgrade-insecure-requests', 1)]
-		urllib.request.install_opener(opener)
 	
 	def load_search_query(self):
 		try:
 			log_debug("[Naver.py] Reading result page")
-			page = urllib.request.urlopen(search_url + urllib.parse.quote_plus(self.word)).read()
+			page = get_transport().get(search_url + urllib.parse.quote_plus(self.word), "naver").content
 			log_debug("[Naver.py] Done with reading result page")
 			
 			self.html = json.loads(page.decode())
 			return self
 		except Exception as e:
-			log_debug("[Naver.py] Exception: " + str(e))
+			log_debug("[Naver.py] Exception: %s", e)
 			if isinstance(e, HTTPError):
 				e: HTTPError
-				if e.code == 404:
+				if e.response.status_code == 404:
 					raise NoResultsException()
 			else:
 				raise e
@@ -110,7 +50,7 @@ class Naver:
 					vote_count = ""
 					dl_url = symbol['symbolFile']
 					is_ogg = True
-					self.pronunciations.append(Pronunciation(self.language, subtitle, origin, id, vote_count, dl_url, is_ogg, self.word, self.mw))
+					self.pronunciations.append(Pronunciation(self.language, subtitle, origin, id, vote_count, dl_url, is_ogg, self.word, self.mw, profile="naver"))
 		#if not self.pronunciations:
 		#	raise NoResultsException()
 		return self
@@ -120,9 +60,3 @@ class Naver:
 			pronunciation.download_pronunciation()
 		
 		return self
-	
-	@staticmethod
-	def cleanup():
-		from .. import temp_dir
-		for f in os.listdir(temp_dir):
-			os.remove(os.path.join(temp_dir, f))
@@ -0,0 +1,82 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Set
+
+from .Dedup import content_hash
+from .Http import Transport, get_transport
+from .Util import log_debug
+
+chunk_size = 16 * 1024
+
+
+class Prefetcher:
+    """Downloads the audio of the first `top_n` listed pronunciations into the transport's response buffer while the
+    user is still looking at the list, so that playing or selecting one of them doesn't need a round trip.
+    At most `max_workers` fetches run at the same time and at most `max_bytes` get buffered.
+    `on_fetched(pronunciation, digest)` is called on the fetching thread with the content hash of every fetched file."""
+
+    def __init__(self, transport: Transport = None, top_n: int = 6, max_workers: int = 2, max_bytes: int = 8 * 1024 * 1024,
+                 on_fetched: Callable = None):
+        self.transport = transport or get_transport()
+        self.on_fetched = on_fetched
+        self.top_n = top_n
+        self.max_bytes = max_bytes
+        self.urls: Set[str] = set()
+        self.keep: Set[str] = set()
+        self.cancelled = threading.Event()
+        self._buffered_bytes = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="audio-dl-prefetch")
+
+    def add(self, pronunciation):
+        """Schedules a listed pronunciation for prefetching if it is among the first `top_n`."""
+        url = pronunciation.download_url
+        if self.cancelled.is_set() or pronunciation.local_path is not None or not url.startswith("http") \
+                or url in self.urls or len(self.urls) >= self.top_n:
+            return  # already on this computer: spooled during the search (JapanesePod101) or in the local library
+        self.urls.add(url)
+        self.transport.buffer.begin(url)
+        self._executor.submit(self._fetch, url, pronunciation)
+
+    def _reserve(self, amount: int) -> bool:
+        with self._lock:
+            if self._buffered_bytes + amount > self.max_bytes:
+                return False
+            self._buffered_bytes += amount
+            return True
+
+    def is_cancelled(self, url: str) -> bool:
+        return self.cancelled.is_set() and url not in self.keep
+
+    def _fetch(self, url: str, pronunciation):
+        if self.is_cancelled(url):
+            self.transport.buffer.abort(url)
+            return
+        try:
+            chunks = []
+            with self.transport.get(url, pronunciation.profile, stream=True) as res:
+                for chunk in res.iter_content(chunk_size):
+                    if self.is_cancelled(url) or not self._reserve(len(chunk)):
+                        log_debug("[Prefetch.py] Stopped prefetching %s", url)
+                        self.transport.buffer.abort(url)
+                        return
+                    chunks.append(chunk)
+            data = b"".join(chunks)
+            self.transport.buffer.put(url, data)
+            if self.is_cancelled(url):
+                self.transport.buffer.discard([url])  # the dialog was closed while this was finishing
+                return
+            log_debug("[Prefetch.py] Prefetched %s", url)
+            if self.on_fetched is not None:
+                self.on_fetched(pronunciation, content_hash(data))
+        except Exception as e:
+            log_debug("[Prefetch.py] Prefetching %s failed: %s", url, e)
+            self.transport.buffer.abort(url)
+
+    def cancel(self, keep: Iterable[str] = ()):
+        """Stops all outstanding fetches and frees everything that was buffered, except for the URLs in `keep`, which
+        are about to be downloaded."""
+        self.keep = set(keep)
+        self.cancelled.set()
+        self._executor.shutdown(wait=False)
+        self.transport.buffer.discard(self.urls - self.keep)
@@ -0,0 +1,102 @@
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass, field
+from typing import List, Union
+
+from aqt import AnkiQt
+
+from .Exceptions import DownloadCancelledException
+from .Http import cancel_requested, get_transport
+from .Trace import span
+
+
+@dataclass
+class Pronunciation:
+	"""A single recording found by one of the sources."""
+	language: str
+	user: str
+	origin: str
+	id: int
+	votes: str
+	download_url: str
+	is_ogg: bool
+	word: str
+	mw: AnkiQt
+	audio: Union[str, None] = None
+	profile: str = "default"  # header profile used for downloads
+	file_name: Union[str, None] = None  # name of the downloaded file, taken from the URL if not set
+	local_path: Union[str, None] = None  # file in temp_dir that already holds the audio, e.g. spooled during the search
+	sources: List[str] = field(default_factory=list)  # every source that had this recording, see Dedup.py
+
+	def get_file_name(self) -> str:
+		return self.file_name or self.download_url.split("/")[-1].split('?')[0]
+
+	def download_pronunciation(self):
+		from .. import temp_dir, audio_store, config
+		from .Dedup import canonical_url
+		from .Transcode import get_variant
+		variant = get_variant(config)
+		# conversions are stored under their own key, so changing the options doesn't reuse the old files
+		# and every spelling of the same URL maps to one entry, so the same recording isn't downloaded twice
+		store_url = canonical_url(self.download_url)
+		if variant is not None:
+			store_url += "#" + variant
+		with span("download", file=self.get_file_name()):
+			self.audio = audio_store.lookup_url(self.mw, store_url)
+			if self.audio is not None:
+				self.discard()
+				return  # already in the collection
+			dl_path = self.make_download_path(temp_dir)
+			try:
+				if self.local_path is not None and os.path.isfile(self.local_path):
+					os.replace(self.local_path, dl_path)
+					self.local_path = None
+				else:
+					get_transport().download(self.download_url, dl_path, self.profile)
+			except BaseException:
+				shutil.rmtree(os.path.dirname(dl_path), ignore_errors=True)
+				raise
+		self.add_to_collection(dl_path, store_url)
+
+	def make_download_path(self, temp_dir: str) -> str:
+		"""A path for the download that no other download uses. The collection names media files after the file they
+		were added from, so every download gets a folder of its own and keeps its file name."""
+		return os.path.join(tempfile.mkdtemp(prefix="download-", dir=temp_dir), self.get_file_name())
+
+	def add_to_collection(self, dl_path: str, store_url: str = None):
+		"""Converts a downloaded file if the options ask for it and adds it to the collection. The collection gets a
+		copy of its own, so the download and its folder are removed afterwards, even if that failed. Within a cancelled
+		Http.cancel_on() nothing gets added."""
+		from .. import audio_store, config
+		from .Transcode import prepare_for_collection
+		try:
+			if cancel_requested():
+				raise DownloadCancelledException()
+			dl_path = prepare_for_collection(dl_path, config)
+			if cancel_requested():
+				raise DownloadCancelledException()  # nothing must end up in the media folder after a cancel
+			with span("media", file=os.path.basename(dl_path)):
+				self.audio = audio_store.add_file(self.mw, dl_path, url=store_url)
+		finally:
+			shutil.rmtree(os.path.dirname(dl_path), ignore_errors=True)
+
+	def discard(self):
+		"""Removes the audio spooled during the search, for pronunciations that aren't going to be downloaded."""
+		if self.local_path is not None:
+			try:
+				os.remove(self.local_path)
+			except OSError:
+				pass
+			self.local_path = None
+
+	def remove_pronunciation(self):
+		self.mw.col.media.trash_files([self.audio])
+		self.audio = None
+
+
+def discard_unused(pronunciations: List[Pronunciation], used: Union[Pronunciation, None] = None):
+	"""Removes the spooled audio of all results of a lookup except the one that gets downloaded."""
+	for pronunciation in pronunciations:
+		if pronunciation is not used:
+			pronunciation.discard()
@@ -0,0 +1,205 @@
+import base64
+import dataclasses
+import json
+import sqlite3
+import threading
+import time
+from typing import List, Union
+
+from .Util import log_debug
+
+day = 24 * 60 * 60
+
+"""How long parsed results of a source stay valid, in seconds"""
+default_ttls = {
+    "Shtooka": 30 * day,
+    "Krdict": 30 * day,
+    "Naver": 7 * day,
+    "JapanesePod101": 30 * day,
+    "JapanesePod101Alt": 7 * day,
+}
+fallback_ttl = 7 * day
+
+"""How long a source is remembered to have had nothing for a query, in seconds. Kept short, since sites add audio."""
+default_miss_ttls = {
+    "Shtooka": 7 * day,
+    "Krdict": 7 * day,
+    "Naver": 2 * day,
+    "JapanesePod101": 3 * day,
+    "JapanesePod101Alt": 2 * day,
+}
+fallback_miss_ttl = 1 * day
+
+"""At most this many known misses are kept, the oldest ones are dropped first"""
+max_known_misses = 50000
+
+"""Fields of a pronunciation that only make sense within the current session and therefore aren't stored"""
+transient_fields = ("mw", "audio", "local_path")
+
+
+def _encode_value(value):
+    if isinstance(value, bytes):
+        return {"__bytes__": base64.b64encode(value).decode("ascii")}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and "__bytes__" in value:
+        return base64.b64decode(value["__bytes__"])
+    return value
+
+
+def serialize_pronunciations(pronunciations: list) -> str:
+    records = []
+    for pronunciation in pronunciations:
+        records.append({f.name: _encode_value(getattr(pronunciation, f.name)) for f in dataclasses.fields(pronunciation)
+                        if f.name not in transient_fields})
+    return json.dumps(records)
+
+
+def deserialize_pronunciations(payload: str) -> List[dict]:
+    return [{k: _decode_value(v) for k, v in record.items()} for record in json.loads(payload)]
+
+
+class ResultCache:
+    """On-disk cache of parsed search results, keyed by (source, language, normalized query).
+    Entries expire after a per-source TTL, and the least recently used entries get evicted once the cache grows
+    beyond `max_bytes`. Queries a source had nothing for are remembered separately with a shorter TTL (see
+    default_miss_ttls), so they aren't looked up again right away. The connection is only opened on first use."""
+
+    def __init__(self, path: str, max_bytes: int = 32 * 1024 * 1024, ttls: dict = None, miss_ttls: dict = None,
+                 max_misses: int = max_known_misses):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_misses = max_misses
+        self.ttls = ttls if ttls is not None else default_ttls
+        self.miss_ttls = miss_ttls if miss_ttls is not None else default_miss_ttls
+        self.hits = 0
+        self.misses = 0
+        self.known_misses = 0
+        self._conn: Union[sqlite3.Connection, None] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS results (
+                source TEXT NOT NULL,
+                language TEXT NOT NULL,
+                query TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (source, language, query))""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS known_misses (
+                source TEXT NOT NULL,
+                language TEXT NOT NULL,
+                query TEXT NOT NULL,
+                created REAL NOT NULL,
+                PRIMARY KEY (source, language, query))""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS known_misses_created ON known_misses (created)")
+            self._conn.commit()
+        return self._conn
+
+    def ttl(self, source: str) -> float:
+        return self.ttls.get(source, fallback_ttl)
+
+    def miss_ttl(self, source: str) -> float:
+        return self.miss_ttls.get(source, fallback_miss_ttl)
+
+    def get(self, source: str, language: str, query: str) -> Union[List[dict], None]:
+        """Returns the cached pronunciation records or None if there is no valid entry."""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT payload, created FROM results WHERE source = ? AND language = ? AND query = ?",
+                               (source, language, query)).fetchone()
+            if row is None or row[1] + self.ttl(source) < now:
+                self.misses += 1
+                log_debug("[ResultCache.py] Miss for %s/%s/%s", source, language, query)
+                return None
+            conn.execute("UPDATE results SET last_used = ? WHERE source = ? AND language = ? AND query = ?",
+                         (now, source, language, query))
+            conn.commit()
+            self.hits += 1
+        log_debug("[ResultCache.py] Hit for %s/%s/%s", source, language, query)
+        return deserialize_pronunciations(row[0])
+
+    def put(self, source: str, language: str, query: str, pronunciations: list):
+        payload = serialize_pronunciations(pronunciations)
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         (source, language, query, payload, len(payload), now, now))
+            conn.execute("DELETE FROM known_misses WHERE source = ? AND language = ? AND query = ?", (source, language, query))
+            self._evict(conn)
+            conn.commit()
+
+    def is_known_miss(self, source: str, language: str, query: str) -> bool:
+        """Whether the source recently had nothing for this query."""
+        with self._lock:
+            row = self._connect().execute("SELECT created FROM known_misses WHERE source = ? AND language = ? AND query = ?",
+                                          (source, language, query)).fetchone()
+            if row is None or row[0] + self.miss_ttl(source) < time.time():
+                return False
+            self.known_misses += 1
+        log_debug("[ResultCache.py] Known miss for %s/%s/%s", source, language, query)
+        return True
+
+    def put_miss(self, source: str, language: str, query: str):
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute("INSERT OR REPLACE INTO known_misses VALUES (?, ?, ?, ?)", (source, language, query, now))
+            self._evict_misses(conn, source, now)
+            conn.commit()
+
+    def clear_misses(self) -> int:
+        """Forgets all known misses, so every query gets looked up again. Returns how many there were."""
+        with self._lock:
+            conn = self._connect()
+            removed = conn.execute("DELETE FROM known_misses").rowcount
+            conn.commit()
+        return removed
+
+    def _evict(self, conn: sqlite3.Connection):
+        """Drops the least recently used entries until the cache fits into `max_bytes` again."""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for rowid, size in conn.execute("SELECT rowid, size FROM results ORDER BY last_used ASC").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM results WHERE rowid = ?", (rowid,))
+            total -= size
+            evicted += 1
+        log_debug("[ResultCache.py] Evicted %d entries", evicted)
+
+    def _evict_misses(self, conn: sqlite3.Connection, source: str, now: float):
+        """Drops the expired misses of `source`, and the oldest misses of all sources beyond `max_misses`."""
+        expired = conn.execute("DELETE FROM known_misses WHERE source = ? AND created < ?",
+                               (source, now - self.miss_ttl(source))).rowcount
+        overflow = conn.execute("SELECT COUNT(*) FROM known_misses").fetchone()[0] - self.max_misses
+        if overflow > 0:
+            conn.execute("DELETE FROM known_misses WHERE rowid IN (SELECT rowid FROM known_misses ORDER BY created ASC LIMIT ?)",
+                         (overflow,))
+        if expired or overflow > 0:
+            log_debug("[ResultCache.py] Dropped %d expired and %d old known misses", expired, max(0, overflow))
+
+    def clear(self):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM results")
+            conn.execute("DELETE FROM known_misses")
+            conn.commit()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
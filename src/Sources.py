@@ -0,0 +1,67 @@
+import importlib
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Union
+
+from .Util import log_debug
+
+
+@dataclass
+class SourceInfo:
+    """Describes a source without importing it. The module only gets imported the first time the source is used."""
+    name: str
+    module: str  # module name relative to this package
+    languages: List[str] = field(default_factory=list)
+    priority: int = 0  # lower goes first
+    fallback: bool = False  # only queried when the primary sources of the language found nothing
+    catch_all: bool = False  # used for every language that has no other source
+    all_languages: bool = False  # used for every language, next to the language's own sources
+    preferred: bool = False  # asked before all other sources, which are skipped if it has results
+    cacheable: bool = True  # whether results and misses go into the search cache
+    reading_field: Union[str, None] = None  # note field passed to the source as the reading of the word
+    timeout: Union[float, None] = None  # overrides the default lookup timeout
+    available: Union[Callable[[object], bool], None] = None  # gets the config, the source is skipped if it returns False
+
+    def load(self):
+        """Returns the source class, importing its module on first use."""
+        cls = _loaded.get(self.name)
+        if cls is None:
+            log_debug("[Sources.py] Loading source %s", self.name)
+            module = importlib.import_module("." + self.module, __package__)
+            cls = _loaded[self.name] = getattr(module, self.name)
+        return cls
+
+
+sources: Dict[str, SourceInfo] = {}
+_loaded: Dict[str, type] = {}
+
+
+def register(info: SourceInfo):
+    sources[info.name] = info
+
+
+def get_source(name: str) -> SourceInfo:
+    return sources[name]
+
+
+def get_sources(language: str) -> List[SourceInfo]:
+    """All sources for a language, ordered by priority. Catch-all sources are only returned if nothing else knows the
+    language."""
+    matching = [s for s in sources.values() if language in s.languages]
+    if not matching:
+        matching = [s for s in sources.values() if s.catch_all]
+    matching += [s for s in sources.values() if s.all_languages]
+    return sorted(matching, key=lambda s: s.priority)
+
+
+def library_exists(config) -> bool:
+    from .LocalLibrary import library_exists
+    return library_exists(config)
+
+
+register(SourceInfo("LocalLibrary", "LocalLibrary", all_languages=True, preferred=True, cacheable=False, available=library_exists))
+register(SourceInfo("JapanesePod101", "JapanesePod101", ["ja"], priority=0, reading_field="Reading"))
+register(SourceInfo("JapanesePod101Alt", "JapanesePod101Alt", ["ja"], priority=1))
+register(SourceInfo("Naver", "Naver", ["ko"], priority=0))
+register(SourceInfo("Krdict", "Krdict", ["ko"], priority=1, fallback=True))
+register(SourceInfo("Shtooka", "Shtooka", ['ar', 'be', 'cs', 'zh', 'de', 'en', 'it', 'fr', 'nl', 'pl', 'pt', 'ru', 'es', 'sv', 'sr', 'uk', 'wo', 'wuu', 'jusi'],
+                    priority=0, catch_all=True))
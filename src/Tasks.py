@@ -0,0 +1,60 @@
+import threading
+from typing import Callable, Any
+
+from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import QProgressDialog, QWidget
+from aqt import AnkiQt
+
+from .Http import cancel_on
+from .Util import log_debug
+
+
+class BackgroundTask:
+    """Runs `task` on Anki's background task manager while a progress dialog with a cancel button is shown.
+    `task` gets a threading.Event that is set once the user cancels, and runs within Http.cancel_on() of it, so its
+    requests and downloads stop as well. Only the callbacks run on the main thread;
+    results of a cancelled task are dropped, after `on_cancelled` got the chance to clean them up."""
+
+    def __init__(self, parent: QWidget, mw: AnkiQt, label: str, task: Callable[[threading.Event], Any],
+                 on_success: Callable[[Any], None], on_failure: Callable[[Exception], None] = None,
+                 on_cancelled: Callable[[Any], None] = None):
+        self.mw = mw
+        self.task = task
+        self.on_success = on_success
+        self.on_failure = on_failure
+        self.on_cancelled = on_cancelled
+        self.cancelled = threading.Event()
+
+        self.progress = QProgressDialog(label, "Cancel", 0, 0, parent)
+        self.progress.setWindowTitle("audio-dl")
+        self.progress.setWindowModality(Qt.WindowModal)
+        self.progress.setMinimumDuration(300)  # don't flash the dialog for cache hits
+        self.progress.canceled.connect(self.cancel)
+
+    def start(self):
+        self.mw.taskman.run_in_background(self.run, self.on_done)
+        return self
+
+    def run(self):
+        with cancel_on(self.cancelled):
+            return self.task(self.cancelled)
+
+    def cancel(self):
+        log_debug("[Tasks.py] Task cancelled by the user")
+        self.cancelled.set()
+
+    def on_done(self, future):
+        self.progress.canceled.disconnect(self.cancel)
+        self.progress.close()
+        if self.cancelled.is_set():
+            if self.on_cancelled is not None and future.exception() is None:
+                self.on_cancelled(future.result())
+            return
+        try:
+            result = future.result()
+        except Exception as e:
+            if self.on_failure is None:
+                raise
+            self.on_failure(e)
+            return
+        self.on_success(result)
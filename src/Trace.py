@@ -0,0 +1,211 @@
+import atexit
+import contextvars
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Union
+
+"""Phases of adding audio, in the order they show up in timing reports"""
+phases = ["query", "http", "parse", "download", "transcode", "media", "field"]
+
+"""The debug log gets rotated once it is bigger than this, keeping `log_backups` older files"""
+max_log_bytes = 2 * 1024 * 1024
+log_backups = 3
+
+"""Timing reports of this many traces are kept in memory for the "Copy timing report" menu entry"""
+kept_reports = 5
+
+_current: contextvars.ContextVar = contextvars.ContextVar("audio_dl_trace", default=None)
+
+
+class Span:
+    """One timed phase. Gets added to the trace that is active on the thread it was started on."""
+    __slots__ = ("phase", "fields", "started", "duration", "thread", "trace")
+
+    def __init__(self, phase: str, fields: Dict[str, object], trace: Union['Trace', None]):
+        self.phase = phase
+        self.fields = fields
+        self.trace = trace
+        self.duration = 0.0
+        self.started = 0.0
+        self.thread = ""
+
+    def __enter__(self) -> 'Span':
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.started
+        self.thread = threading.current_thread().name
+        if exc_type is not None:
+            self.fields["error"] = exc_type.__name__
+        if self.trace is not None:
+            self.trace.add(self)
+        return False
+
+
+class _NullSpan:
+    """What span() returns while tracing is off: entering and leaving it costs next to nothing."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+class Trace:
+    """The spans of one lookup (or bulk add), from the search to writing the field, across all threads that worked
+    on it. Threads join the trace with activate() or by running a function wrapped with bind()."""
+
+    def __init__(self, tracer: 'Tracer', name: str, fields: Dict[str, object]):
+        self.tracer = tracer
+        self.name = name
+        self.fields = fields
+        self.started = time.perf_counter()
+        self.spans: List[Span] = []
+        self.finished = False
+        self._lock = threading.Lock()
+
+    def add(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def activate(self) -> 'TraceScope':
+        return TraceScope(self)
+
+    def bind(self, fn: Callable) -> Callable:
+        """Wraps `fn` so that it runs within this trace, e.g. on a background thread."""
+        def run(*args, **kwargs):
+            with TraceScope(self):
+                return fn(*args, **kwargs)
+        return run
+
+    def finish(self):
+        """Writes the timing report to the log and keeps it for the menu entry. Only the first call counts."""
+        with self._lock:
+            if self.finished:
+                return
+            self.finished = True
+        self.tracer.add_report(self.report())
+
+    def report(self) -> str:
+        """Time spent per phase, then every span in the order it started."""
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.started)
+        total = time.perf_counter() - self.started
+        lines = ["%s %s, %.1f ms in total" % (self.name, " ".join("%s=%s" % item for item in self.fields.items()), total * 1000)]
+        totals: Dict[str, List[float]] = {}
+        for span in spans:
+            totals.setdefault(span.phase, []).append(span.duration)
+        for phase in sorted(totals, key=lambda p: phases.index(p) if p in phases else len(phases)):
+            lines.append("  %-9s %4d x %9.1f ms" % (phase, len(totals[phase]), sum(totals[phase]) * 1000))
+        for span in spans:
+            lines.append("    +%8.1f ms %-9s %8.1f ms  %-22s %s" % (
+                (span.started - self.started) * 1000, span.phase, span.duration * 1000, span.thread,
+                " ".join("%s=%s" % item for item in span.fields.items())))
+        return "\n".join(lines)
+
+
+class _NullTrace:
+    """What start_trace() returns while tracing is off."""
+
+    def activate(self):
+        return _null_span
+
+    def bind(self, fn: Callable) -> Callable:
+        return fn
+
+    def finish(self):
+        pass
+
+
+class TraceScope:
+    def __init__(self, trace: Trace):
+        self.trace = trace
+        self.token = None
+
+    def __enter__(self):
+        self.token = _current.set(self.trace)
+        return self.trace
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self.token)
+        return False
+
+
+class Tracer:
+    """Debug log and timing spans. Off unless enable() was called (i.e. user_files/.debug exists), and then
+    log lines are handed to a background thread that writes them to a rotating file, so neither logging nor
+    spans ever wait for the disk."""
+
+    def __init__(self):
+        self.enabled = False
+        self.reports: List[str] = []
+        self._logger = logging.getLogger("audio_dl")
+        self._logger.propagate = False
+        self._listener: Union[logging.handlers.QueueListener, None] = None
+        self._lock = threading.Lock()
+
+    def enable(self, log_dir: str, file_name: str = "debug"):
+        with self._lock:
+            if self.enabled:
+                return
+            os.makedirs(log_dir, exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(os.path.join(log_dir, file_name), maxBytes=max_log_bytes,
+                                                           backupCount=log_backups, encoding="utf8")
+            handler.setFormatter(logging.Formatter("%(asctime)s %(threadName)s %(message)s"))
+            log_queue = queue.SimpleQueue()
+            self._logger.addHandler(logging.handlers.QueueHandler(log_queue))
+            self._logger.setLevel(logging.DEBUG)
+            self._listener = logging.handlers.QueueListener(log_queue, handler)
+            self._listener.start()
+            atexit.register(self.close)
+            self.enabled = True
+
+    def log(self, msg: str, *args):
+        """Logs `msg % args`. The message only gets formatted if tracing is on."""
+        if self.enabled:
+            self._logger.debug(msg, *args)
+
+    def start_trace(self, name: str, **fields) -> Union[Trace, _NullTrace]:
+        if not self.enabled:
+            return _null_trace
+        return Trace(self, name, fields)
+
+    def add_report(self, report: str):
+        self.log("[Trace.py] Timing report\n%s", report)
+        with self._lock:
+            self.reports = (self.reports + [report])[-kept_reports:]
+
+    def last_report(self) -> Union[str, None]:
+        with self._lock:
+            return self.reports[-1] if self.reports else None
+
+    def close(self):
+        """Writes out everything that is still queued."""
+        with self._lock:
+            if self._listener is not None:
+                self._listener.stop()
+                self._listener = None
+            self.enabled = False
+
+
+_null_span = _NullSpan()
+_null_trace = _NullTrace()
+tracer = Tracer()
+
+
+def span(phase: str, **fields) -> Union[Span, _NullSpan]:
+    """Times a phase within the trace that is active on this thread, e.g. `with span("http", host=host): ...`"""
+    if not tracer.enabled:
+        return _null_span
+    return Span(phase, fields, _current.get())
+
+
+def current_trace() -> Union[Trace, None]:
+    return _current.get()
@@ -0,0 +1,267 @@
+import os
+import shutil
+import subprocess
+import sys
+import threading
+from typing import Callable, Dict, List, Tuple, Union
+
+from .AudioStore import hash_file
+from .Config import Config
+from .Trace import span
+from .Util import log_debug
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+"""Formats .ogg downloads can be converted to: file extension, ffmpeg muxer, codec and quality arguments"""
+formats: Dict[str, Tuple[str, str, str, List[str]]] = {
+    "mp3": (".mp3", "mp3", "libmp3lame", ["-q:a", "4"]),
+    "aac": (".m4a", "ipod", "aac", ["-b:a", "96k"]),
+}
+
+"""First bytes of the containers Anki's iOS app can't play: Ogg (Vorbis, Opus, Speex) and WebM"""
+unplayable_signatures = (b"OggS", b"\x1a\x45\xdf\xa3")
+
+"""Seconds a single conversion may take"""
+transcode_timeout = 60
+
+"""Converted files are kept by the hash of their input until the cache gets bigger than this"""
+max_cache_bytes = 256 * 1024 * 1024
+
+"""Silence detection: the audio is decoded to mono at `analysis_rate` and cut into frames of `frame_length`
+seconds. Frames more than `silence_threshold_db` below the loudest frame are silence, `silence_padding` seconds
+of it are kept before and after the audible part."""
+analysis_rate = 16000
+frame_length = 0.01
+silence_threshold_db = 40.0
+silence_padding = 0.1
+
+_ffmpeg_paths: Dict[str, Union[str, None]] = {}
+_transcoder: Union['Transcoder', None] = None
+_transcoder_lock = threading.Lock()
+
+
+def needs_transcode(path: str) -> bool:
+    with open(path, "rb") as f:
+        return f.read(4).startswith(unplayable_signatures)
+
+
+def find_ffmpeg(config: Config) -> Union[str, None]:
+    """The ffmpeg set in the options, else the one on the PATH. None if there is none."""
+    configured = config.get_config_object("ffmpegPath").value or ""
+    if configured not in _ffmpeg_paths:
+        if configured:
+            _ffmpeg_paths[configured] = configured if os.path.isfile(configured) else None
+        else:
+            _ffmpeg_paths[configured] = shutil.which("ffmpeg")
+    return _ffmpeg_paths[configured]
+
+
+def get_format(config: Config) -> Union[str, None]:
+    """The format .ogg downloads get converted to. None if that is turned off or ffmpeg can't be found."""
+    fmt = config.get_config_object("transcodeOgg").value
+    if fmt not in formats or find_ffmpeg(config) is None:
+        return None
+    return fmt
+
+
+def get_shrink_bitrate(config: Config) -> Union[int, None]:
+    """The bitrate in kbit/s downloads get re-encoded with. None if shrinking is turned off or ffmpeg can't be found."""
+    if not config.get_config_object("shrinkAudio").value or find_ffmpeg(config) is None:
+        return None
+    return int(config.get_config_object("shrinkBitrate").value)
+
+
+def get_variant(config: Config) -> Union[str, None]:
+    """Names what prepare_for_collection() does to downloads, e.g. "mp3-32k". None if it leaves them alone."""
+    fmt = get_format(config)
+    bitrate = get_shrink_bitrate(config)
+    if bitrate is not None:
+        return "%s-%dk" % (fmt or "mp3", bitrate)
+    return fmt
+
+
+def skip_ogg(config: Config) -> bool:
+    """Whether .ogg results have to be dropped, because they are unwanted and can't be converted."""
+    return config.get_config_object("skipOggFallback").value and get_format(config) is None
+
+
+def get_transcoder(config: Config) -> 'Transcoder':
+    global _transcoder
+    from .. import user_files_dir
+    ffmpeg = find_ffmpeg(config)
+    with _transcoder_lock:
+        if _transcoder is None or _transcoder.ffmpeg != ffmpeg:
+            _transcoder = Transcoder(ffmpeg, os.path.join(user_files_dir, "transcoded"))
+        return _transcoder
+
+
+def prepare_for_collection(path: str, config: Config) -> str:
+    """The stage between downloading a file and adding it to the collection. Returns the path of the file to add:
+    trimmed and re-encoded if shrinking is on, converted if it is in a format iOS can't play and converting is on,
+    else `path` itself."""
+    fmt = get_format(config)
+    bitrate = get_shrink_bitrate(config)
+    if bitrate is not None:
+        return get_transcoder(config).shrink(path, fmt or "mp3", bitrate)
+    if fmt is None or not needs_transcode(path):
+        return path
+    return get_transcoder(config).transcode(path, fmt)
+
+
+def find_audible_range(samples, rate: int) -> Tuple[float, float]:
+    """(start, end) in seconds of the part of `samples` (a numpy array of mono samples) that isn't silence."""
+    duration = len(samples) / rate
+    frame = int(rate * frame_length)
+    count = len(samples) // frame
+    if count == 0:
+        return 0.0, duration
+    frames = samples[:count * frame].astype(numpy.float32).reshape(count, frame)
+    loudness = numpy.sqrt(numpy.mean(frames * frames, axis=1))
+    peak = loudness.max()
+    if peak == 0:
+        return 0.0, duration  # nothing but silence, better leave it alone
+    audible = numpy.flatnonzero(loudness >= peak * 10 ** (-silence_threshold_db / 20))
+    start = max(0.0, audible[0] * frame_length - silence_padding)
+    end = min(duration, (audible[-1] + 1) * frame_length + silence_padding)
+    return float(start), float(end)
+
+
+class Transcoder:
+    """Converts audio with a local ffmpeg. Every conversion is its own ffmpeg process, and at most `workers` of
+    them (one per core by default) run at the same time, no matter how many threads ask for conversions.
+    Outputs are cached by the hash of their input, so a recording only ever gets converted once."""
+
+    def __init__(self, ffmpeg: str, cache_dir: str, workers: int = None):
+        self.ffmpeg = ffmpeg
+        self.cache_dir = cache_dir
+        self._slots = threading.BoundedSemaphore(workers or os.cpu_count() or 1)
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self._cache_bytes: Union[int, None] = None
+        self._shrunk = 0
+        self._saved = 0
+
+    def transcode(self, path: str, fmt: str) -> str:
+        """Replaces `path` with a converted file next to it and returns its path. If ffmpeg fails, `path` is
+        returned unchanged, so the recording can still be used as it is."""
+        extension, muxer, codec, quality_args = formats[fmt]
+        cached = self._convert(path, fmt, extension, lambda: ["-i", path, "-codec:a", codec] + quality_args + ["-f", muxer])
+        return path if cached is None else self._replace(path, cached, extension)
+
+    def shrink(self, path: str, fmt: str, bitrate: int) -> str:
+        """Trims the silence at both ends of `path` and re-encodes it in mono at `bitrate` kbit/s. Like transcode(),
+        but files that are playable already are kept as they are if that doesn't make them smaller."""
+        extension, muxer, codec, _ = formats[fmt]
+
+        def arguments() -> List[str]:
+            start, end = self._audible_range(path)
+            trim = ["-ss", "%.3f" % start, "-to", "%.3f" % end] if end is not None else []
+            return ["-i", path] + trim + ["-ac", "1", "-codec:a", codec, "-b:a", "%dk" % bitrate, "-f", muxer]
+
+        size = os.path.getsize(path)
+        cached = self._convert(path, "%s-%dk" % (fmt, bitrate), extension, arguments)
+        if cached is None:
+            return path
+        saved = size - os.path.getsize(cached)
+        if saved <= 0 and not needs_transcode(path):
+            return path
+        with self._lock:
+            self._shrunk += 1
+            self._saved += saved
+        log_debug("[Transcode.py] Shrunk %s by %d bytes", path, saved)
+        return self._replace(path, cached, extension)
+
+    def report(self) -> Tuple[int, int]:
+        """(files, bytes) shrunk and saved since the last reset_report()."""
+        with self._lock:
+            return self._shrunk, self._saved
+
+    def reset_report(self):
+        with self._lock:
+            self._shrunk = self._saved = 0
+
+    def _audible_range(self, path: str) -> Tuple[float, Union[float, None]]:
+        """Decodes the file and finds where the silence around the recording starts and ends. (0, None) if that
+        isn't possible, which re-encodes the whole file."""
+        if numpy is None:
+            return 0.0, None
+        command = [self.ffmpeg, "-nostdin", "-hide_banner", "-loglevel", "error", "-i", path, "-vn",
+                   "-ac", "1", "-ar", str(analysis_rate), "-f", "s16le", "-"]
+        result = self._run(command, capture=True)
+        if result is None or not result.stdout:
+            return 0.0, None
+        samples = numpy.frombuffer(result.stdout[:len(result.stdout) // 2 * 2], dtype="<i2")
+        start, end = find_audible_range(samples, analysis_rate)
+        log_debug("[Transcode.py] Audible part of %s: %.2fs to %.2fs of %.2fs", path, start, end, len(samples) / analysis_rate)
+        return start, end
+
+    def _convert(self, path: str, variant: str, extension: str, arguments: Callable[[], List[str]]) -> Union[str, None]:
+        """Runs ffmpeg with `arguments()` unless the cache already has this variant of the file. Returns the path
+        of the cached output, None if ffmpeg failed."""
+        key = hash_file(path) + "-" + variant
+        cached = os.path.join(self.cache_dir, key + extension)
+        with self._key_lock(key):
+            if os.path.isfile(cached):
+                log_debug("[Transcode.py] Using the cached conversion of %s", path)
+                return cached
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_path = cached + ".part"
+            with self._slots, span("transcode", variant=variant, file=os.path.basename(path)):
+                command = [self.ffmpeg, "-nostdin", "-hide_banner", "-loglevel", "error", "-y"] + arguments() + \
+                          ["-vn", "-map_metadata", "-1", temp_path]
+                result = self._run(command)
+            if result is None or result.returncode != 0 or not os.path.isfile(temp_path):
+                if result is not None:
+                    log_debug("[Transcode.py] ffmpeg failed for %s: %s", path, result.stderr.decode(errors="replace").strip())
+                if os.path.isfile(temp_path):
+                    os.remove(temp_path)
+                return None
+            os.replace(temp_path, cached)
+        self._account(os.path.getsize(cached))
+        return cached
+
+    @staticmethod
+    def _replace(path: str, cached: str, extension: str) -> str:
+        """Puts a copy of the cached output next to `path` and removes `path`."""
+        out_path = os.path.splitext(path)[0] + extension
+        shutil.copyfile(cached, out_path)
+        if out_path != path:
+            os.remove(path)
+        return out_path
+
+    def _run(self, command: List[str], capture: bool = False) -> Union[subprocess.CompletedProcess, None]:
+        # no console window popping up for every file on Windows
+        flags = subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0
+        try:
+            return subprocess.run(command, stdout=subprocess.PIPE if capture else subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                  timeout=transcode_timeout, creationflags=flags)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            log_debug("[Transcode.py] Couldn't run ffmpeg: %s", e)
+            return None
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        """Two threads converting the same input wait for each other instead of both running ffmpeg."""
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _account(self, added: int):
+        """Keeps the cache below max_cache_bytes by removing the oldest conversions."""
+        with self._lock:
+            if self._cache_bytes is None:
+                self._cache_bytes = sum(entry.stat().st_size for entry in os.scandir(self.cache_dir) if entry.is_file())
+            else:
+                self._cache_bytes += added
+            if self._cache_bytes <= max_cache_bytes:
+                return
+            entries = sorted((entry for entry in os.scandir(self.cache_dir) if entry.is_file()),
+                             key=lambda entry: entry.stat().st_mtime)
+            for entry in entries:
+                if self._cache_bytes <= max_cache_bytes // 2:
+                    break
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                self._cache_bytes -= size
+            log_debug("[Transcode.py] Pruned the conversion cache to %d bytes", self._cache_bytes)
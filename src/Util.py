@@ -7,7 +7,9 @@ from PyQt5.QtWidgets import QScrollBar, QWidget
 from anki.cards import Card
 from anki.notes import Note
 
+from .Config import Config
 from .Exceptions import FieldNotFoundException
+from .Trace import tracer
 
 
 def get_field_id(field_name: str, note: Note) -> int:
@@ -17,6 +19,17 @@ def get_field_id(field_name: str, note: Note) -> int:
     return res
 
 
+def add_audio_string(note: Note, field_name: str, audio: str, add_mode: str):
+    """Puts a sound tag for `audio` into a field, according to the 'audioFieldAddMode' option."""
+    field_id = get_field_id(field_name, note)
+    if add_mode == "append":
+        note.fields[field_id] += "[sound:%s]" % audio
+    elif add_mode == "replace":
+        note.fields[field_id] = "[sound:%s]" % audio
+    else:
+        note.fields[field_id] = "[sound:%s]" % audio + note.fields[field_id]
+
+
 class CustomScrollbar(QScrollBar):
     def __init__(self, *__args):
         super().__init__(*__args)
@@ -65,11 +78,20 @@ def open_file(path):
         subprocess.Popen(["xdg-open", path])
 
 
-def log_debug(msg):
-    from .. import user_files_dir, debug_mode
-    if debug_mode:
-        with open(os.path.join(user_files_dir, "logs", "debug"), "a", encoding="utf8") as f:
-            f.write(msg + "\n")
+def log_debug(msg: str, *args):
+    """Writes `msg % args` to user_files/logs/debug if debugging is on. Formatting is skipped when it is off."""
+    if tracer.enabled:
+        tracer.log(msg, *args)
+
+
+def prepare_query_string(input: str, config: Config) -> str:
+    """The word as the sources search for it: stripped, and without the characters of the 'replaceCharacters' option."""
+    query = str(input)
+    query = query.strip()
+    for char in config.get_config_object("replaceCharacters").value:
+        query = query.replace(char, "")
+    log_debug("[Util.py] Using search query: %s", query)
+    return query
 
 
 def delete_layout_contents(layout):